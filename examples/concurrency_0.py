@@ -0,0 +1,103 @@
+import time
+import queue
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from modpack_builder.network import ConnectionPool, ConcurrencyController
+
+
+class StubHostHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    body = b"x" * 64 * 1024
+
+    # The host serves this many requests at full speed, beyond that they queue,
+    # and beyond the overload it answers with a 503 as if it were throttling.
+    capacity = 6
+    overload = 12
+    latency = 0.05
+
+    lock = threading.Lock()
+    active = 0
+
+    def do_GET(self):
+        with StubHostHandler.lock:
+            StubHostHandler.active += 1
+            active = StubHostHandler.active
+
+        try:
+            if active > self.overload:
+                self.send_response(503)
+                self.send_header("content-length", "0")
+                self.end_headers()
+                return
+
+            time.sleep(self.latency * max(1, active / self.capacity))
+
+            self.send_response(200)
+            self.send_header("content-length", str(len(self.body)))
+            self.end_headers()
+            self.wfile.write(self.body)
+        finally:
+            with StubHostHandler.lock:
+                StubHostHandler.active -= 1
+
+    def log_message(self, *_):
+        pass
+
+
+def run_benchmark(label, url, controller, count=600):
+    connection_pool = ConnectionPool(controller.maximum)
+    pending = queue.Queue()
+    errors = 0
+
+    for index in range(count):
+        pending.put(index)
+
+    def __worker():
+        nonlocal errors
+
+        while True:
+            try:
+                pending.get_nowait()
+            except queue.Empty:
+                return
+
+            with controller.slot():
+                start_time = time.monotonic()
+                response = connection_pool.get(url)
+
+                if response.status_code == 200:
+                    controller.record_success(time.monotonic() - start_time, len(response.content))
+                    continue
+
+            # A throttled request is put back to be sent again
+            errors += 1
+            controller.record_error()
+            pending.put(None)
+
+    start_time = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=controller.maximum) as executor:
+        for _ in range(controller.maximum):
+            executor.submit(__worker)
+
+    elapsed_time = time.perf_counter() - start_time
+    connection_pool.close()
+
+    print(f"{label:>14}: {count / elapsed_time:.0f} requests per second, {errors} throttled, {controller.report()}")
+
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHostHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    host_url = f"http://127.0.0.1:{server.server_port}/"
+
+    run_benchmark("fixed at 2", host_url, ConcurrencyController(2, minimum=2, maximum=2))
+    run_benchmark("fixed at 16", host_url, ConcurrencyController(16, minimum=16, maximum=16))
+    run_benchmark("adaptive", host_url, ConcurrencyController(2, maximum=16))
+
+    server.shutdown()
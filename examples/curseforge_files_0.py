@@ -0,0 +1,84 @@
+import gc
+import sys
+import json
+import time
+import random
+import tracemalloc
+
+from pathlib import Path
+
+from modpack_builder.curseforge import CurseForgeMod, ReleaseType
+
+
+def make_response(file_count=3000):
+    # Shaped like a response from the widget API for a project such as 'jei' or 'journeymap' with thousands of files,
+    # seeded so that every run measures the same response.
+    generator = random.Random(0)
+    game_versions = [f"1.{minor}.{patch}" for minor in range(7, 20) for patch in range(5)]
+    files = list()
+
+    for index in range(file_count):
+        file_versions = generator.sample(game_versions, 3) + ["Forge"]
+        file_id = 2000000 + index
+
+        files.append({
+            "id": file_id,
+            "url": f"https://www.curseforge.com/minecraft/mc-mods/example/files/{file_id}",
+            "display": f"Example {index}",
+            "name": f"example-{index}.jar",
+            "type": generator.choice(("release", "beta", "alpha")),
+            "version": file_versions[0],
+            "filesize": generator.randrange(64 * 1024, 4 * 1024 * 1024),
+            "versions": file_versions,
+            "downloads": generator.randrange(100000),
+            "uploaded_at": f"20{10 + index // 400:02}-{index % 12 + 1:02}-01T00:00:00+00:00"
+        })
+
+    return json.dumps({"id": 1, "title": "Example", "links": [], "files": files})
+
+
+def measure(label, response_json, materialize_all):
+    # Every run needs its own copy, the constructor is given the same structure that `CurseForgeMod.get` would give it.
+    # It is parsed before anything is traced, so that neither the time nor the peak includes the parse.
+    response = json.loads(response_json)
+
+    tracemalloc.start()
+    start_time = time.process_time()
+
+    curseforge_mod = CurseForgeMod("benchmark", **response)
+
+    if materialize_all:
+        # This is the amount of work the constructor used to do before files were parsed lazily
+        _ = curseforge_mod.files
+
+    best_file = curseforge_mod.best_file(("1.12.2",), ReleaseType.release)
+
+    elapsed_time = time.process_time() - start_time
+    _, peak_memory = tracemalloc.get_traced_memory()
+
+    # What is still traced once the response is gone is kept alive by the instance for as long as it is cached.
+    # The strings it shares with the response were allocated before tracing, and are the same in both forms.
+    del response
+    gc.collect()
+    retained_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"{label:>6}: {elapsed_time * 1000:.1f}ms CPU, {peak_memory / 1024 / 1024:.2f}MiB peak, "
+        f"{retained_memory / 1024 / 1024:.2f}MiB retained, best file {best_file.name if best_file else None}"
+    )
+
+
+if __name__ == "__main__":
+    # Optionally the path to a response saved from the widget API, otherwise one is generated so that the results
+    # never depend on the network or on how many files the project happens to have today.
+    if len(sys.argv) > 1:
+        response_text = Path(sys.argv[1]).read_text(encoding="utf-8")
+    else:
+        response_text = make_response()
+
+    print(f"Response contains {len(json.loads(response_text).get('files', tuple()))} files")
+
+    for _ in range(3):
+        measure("eager", response_text, True)
+        measure("lazy", response_text, False)
@@ -0,0 +1,77 @@
+import json
+import time
+import random
+import tracemalloc
+
+import modpack_builder.curseforge as curseforge
+
+from modpack_builder.curseforge import CurseForgeMod
+
+
+def make_response(file_count=3000, description_size=200 * 1024):
+    # Shaped like a response from the widget API for a popular project with thousands of files,
+    # where each file appears once in the files and again under every version that it lists.
+    game_versions = [f"1.{minor}.{patch}" for minor in range(7, 20) for patch in range(5)]
+    files = list()
+    versions = dict()
+
+    for index in range(file_count):
+        file_versions = random.sample(game_versions, 4) + ["Forge"]
+        file_id = 2000000 + index
+
+        files.append({
+            "id": file_id,
+            "url": f"https://www.curseforge.com/minecraft/mc-mods/example/files/{file_id}",
+            "display": f"Example {index}",
+            "name": f"example-{index}.jar",
+            "type": "release",
+            "version": file_versions[0],
+            "filesize": 1024 * 1024,
+            "versions": file_versions,
+            "downloads": 1000,
+            "uploaded_at": "2020-01-01T00:00:00+00:00"
+        })
+
+        for version in file_versions:
+            versions.setdefault(version, list()).append(files[-1])
+
+    paragraph = "<p>An \"example\" mod, with <a href=\"https://example.com\">a link</a> and some text.</p>\n"
+
+    return json.dumps({
+        "id": 1,
+        "title": "Example",
+        "urls": {"curseforge": "https://www.curseforge.com/minecraft/mc-mods/example", "project": None},
+        "links": [],
+        "files": files,
+        "versions": versions,
+        "description": paragraph * (description_size // len(paragraph))
+    }).encode()
+
+
+def run_benchmark(label, content, parse, repeat=10):
+    # The fastest run is the one least disturbed by the garbage collector and the rest of the system
+    elapsed_time = None
+
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        CurseForgeMod("example", **parse(content))
+        elapsed_time = min(elapsed_time or float("inf"), time.perf_counter() - start_time)
+
+    tracemalloc.start()
+    CurseForgeMod("example", **parse(content))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print(f"{label:>18}: {elapsed_time * 1000:.1f}ms per project, {peak / 1024 / 1024:.1f} MiB peak")
+
+
+if __name__ == "__main__":
+    response_content = make_response()
+
+    print(f"Response of {len(response_content) / 1024 / 1024:.1f} MiB")
+
+    run_benchmark("json.loads", response_content, json.loads)
+    run_benchmark("with description", response_content, lambda content: curseforge._parse_object(
+        content.decode("utf-8"), curseforge.CURSEFORGE_SKIPPED_KEYS - {"description"}
+    ))
+    run_benchmark("selective", response_content, lambda content: curseforge._parse_object(content.decode("utf-8")))
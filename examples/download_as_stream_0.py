@@ -0,0 +1,72 @@
+import os
+import time
+import tempfile
+import threading
+
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import modpack_builder.utilities as utilities
+
+from modpack_builder.network import ConnectionPool
+from modpack_builder.utilities import ProgressReporter
+
+
+class CountingProgressReporter(ProgressReporter):
+    # Stands in for `ProgressBarReporter`, which emits a signal to the GUI thread every time a value is reported
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.updates = 0
+
+    def _report_value(self, value):
+        self.updates += 1
+
+
+class StubFileHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    body = os.urandom(32 * 1024 * 1024)
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("content-type", "application/java-archive")
+        self.send_header("content-length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *_):
+        pass
+
+
+def run_benchmark(url, path, session, block_size):
+    reporter = CountingProgressReporter()
+
+    start_time = time.process_time()
+    utilities.download_as_stream(url, path, reporter=reporter, block_size=block_size, session=session)
+    elapsed_time = time.process_time() - start_time
+
+    size = len(StubFileHandler.body) / 1024 / 1024
+
+    print(
+        f"{'adaptive' if block_size is None else f'{block_size} bytes':>10}: "
+        f"{elapsed_time / size * 1000:.2f}ms CPU per MiB, {reporter.updates} progress updates"
+    )
+
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubFileHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    file_url = f"http://127.0.0.1:{server.server_port}/example.jar"
+    connection_pool = ConnectionPool(1)
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        file_path = Path(temporary_directory) / "example.jar"
+
+        for _ in range(3):
+            run_benchmark(file_url, file_path, connection_pool, 1024)
+            run_benchmark(file_url, file_path, connection_pool, 64 * 1024)
+            run_benchmark(file_url, file_path, connection_pool, None)
+
+    server.shutdown()
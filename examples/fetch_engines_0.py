@@ -0,0 +1,111 @@
+import json
+import time
+import threading
+import multiprocessing
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import modpack_builder.curseforge as curseforge
+
+from modpack_builder.builder import ModpackBuilder, FetchEngine
+from modpack_builder.manifest import ModpackManifest
+
+
+class StubCurseForgeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Simulated round trip time of the API, so that the engines are compared by how well they overlap requests
+    latency = 0.05
+
+    def do_GET(self):
+        identifier = self.path.strip("/")
+        body = json.dumps({
+            "id": abs(hash(identifier)) % 1000000,
+            "title": identifier.title(),
+            "links": [],
+            "files": [
+                {
+                    "id": 3000000 + index,
+                    "name": f"{identifier}-{index}.jar",
+                    "type": "release",
+                    "versions": ["1.12.2"],
+                    "filesize": 1024,
+                    "uploaded_at": "2020-01-01T00:00:00+00:00"
+                }
+                for index in range(10)
+            ]
+        }).encode("utf-8")
+
+        time.sleep(self.latency)
+
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+def run_benchmark(builder, engine):
+    builder.fetch_engine = engine
+    peak_threads = threading.active_count()
+    finished = threading.Event()
+
+    def __sample_threads():
+        nonlocal peak_threads
+
+        while not finished.wait(0.005):
+            peak_threads = max(peak_threads, threading.active_count())
+
+    sampler = threading.Thread(target=__sample_threads, daemon=True)
+    sampler.start()
+
+    start_time = time.perf_counter()
+    builder.fetch_curseforge_mods()
+    elapsed_time = time.perf_counter() - start_time
+
+    finished.set()
+    sampler.join()
+
+    print(
+        f"{engine.value:>8}: {len(builder.curseforge_mods)} mods in {elapsed_time:.3f}s, "
+        f"peak of {peak_threads} threads"
+    )
+
+
+class StubCurseForgeServer(ThreadingHTTPServer):
+    # The default backlog of 5 would drop most of the connections opened in a burst by either engine
+    request_queue_size = 1024
+
+
+def serve_stub_api(port):
+    server = StubCurseForgeServer(("127.0.0.1", port), StubCurseForgeHandler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    # The server runs in its own process so that its threads are not counted against the engines
+    server_port = 8765
+    server_process = multiprocessing.Process(target=serve_stub_api, args=(server_port,), daemon=True)
+    server_process.start()
+    time.sleep(0.5)
+
+    curseforge.CURSEFORGE_API_BASE_URL = f"http://127.0.0.1:{server_port}/{{}}"
+
+    builder = ModpackBuilder()
+    builder.logger = lambda *_: None
+    builder.manifest = ModpackManifest({
+        "game_versions": ["1.12.2"],
+        "client": {"curseforge_mods": [f"example-mod-{index}" for index in range(400)]}
+    })
+
+    for concurrency in (8, 64, 256):
+        print(f"Concurrent requests: {concurrency}")
+        builder.concurrent_requests = concurrency
+
+        run_benchmark(builder, FetchEngine.threads)
+        run_benchmark(builder, FetchEngine.asyncio)
+
+    server_process.terminate()
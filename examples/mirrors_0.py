@@ -0,0 +1,113 @@
+import os
+import time
+import random
+import tempfile
+import threading
+
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import modpack_builder.utilities as utilities
+
+from modpack_builder.network import ConnectionPool, MirrorSelector
+
+
+class StubMirrorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    body = os.urandom(256 * 1024)
+
+    # Overridden by each mirror, the time taken before the response and the chance of stalling for much longer
+    latency = 0.02
+    stall_chance = 0
+    stall_time = 0
+
+    def do_GET(self):
+        if random.random() < self.stall_chance:
+            time.sleep(self.stall_time)
+        else:
+            time.sleep(self.latency)
+
+        self.send_response(200)
+        self.send_header("content-type", "application/java-archive")
+        self.send_header("content-length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *_):
+        pass
+
+
+class FlakyMirrorHandler(StubMirrorHandler):
+    # Usually the fastest, but one in five responses stalls as if the edge node were overloaded
+    latency = 0.02
+    stall_chance = 0.2
+    stall_time = 1.5
+
+
+class SteadyMirrorHandler(StubMirrorHandler):
+    latency = 0.08
+
+
+class StubMirrorServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # The losing request of every hedge is closed by the client before its response is read
+        pass
+
+
+def start_server(handler):
+    server = StubMirrorServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, f"http://127.0.0.1:{server.server_port}/files/{{}}/{{}}/{{}}"
+
+
+def run_benchmark(label, mirrors, selector, directory, count=200, concurrency=8):
+    connection_pool = ConnectionPool(concurrency * len(mirrors))
+    durations = list()
+
+    def __target(index):
+        urls = tuple(mirror.format("1234", "567", f"file-{index}.jar") for mirror in mirrors)
+        start_time = time.perf_counter()
+
+        utilities.download_as_stream(
+            urls if len(urls) > 1 else urls[0],
+            Path(directory) / f"file-{index}.jar",
+            session=connection_pool,
+            mirrors=selector
+        )
+
+        durations.append(time.perf_counter() - start_time)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(__target, range(count)))
+
+    connection_pool.close()
+    durations.sort()
+
+    def __percentile(fraction):
+        return durations[min(int(len(durations) * fraction), len(durations) - 1)] * 1000
+
+    print(
+        f"{label:>14}: p50 {__percentile(0.5):.0f}ms, p95 {__percentile(0.95):.0f}ms, "
+        f"p99 {__percentile(0.99):.0f}ms, max {durations[-1] * 1000:.0f}ms"
+    )
+
+    for line in selector.report() if selector else tuple():
+        print(f"{'':>16}{line}")
+
+
+if __name__ == "__main__":
+    flaky_server, flaky_mirror = start_server(FlakyMirrorHandler)
+    steady_server, steady_mirror = start_server(SteadyMirrorHandler)
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        run_benchmark("flaky only", (flaky_mirror,), None, temporary_directory)
+        run_benchmark("steady only", (steady_mirror,), None, temporary_directory)
+        run_benchmark("both, hedged", (flaky_mirror, steady_mirror), MirrorSelector(), temporary_directory)
+
+    flaky_server.shutdown()
+    steady_server.shutdown()
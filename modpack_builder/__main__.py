@@ -0,0 +1,185 @@
+import sys
+import json
+import zipfile
+import argparse
+import threading
+import concurrent.futures
+
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from modpack_builder.logs import LogSink, LogLevel
+from modpack_builder.cache import CurseForgeCache
+from modpack_builder.store import FileStore
+from modpack_builder.builder import ModpackBuilder
+
+
+# Nothing in here may import Qt, this entry point is for machines without a display such as servers and CI runners.
+
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(
+        prog="modpack_builder",
+        description="Install the mods of a modpack package without the graphical interface."
+    )
+
+    parser.add_argument("package", type=Path, help="path to the modpack package to install")
+    parser.add_argument("--minecraft-directory", type=Path, help="the '.minecraft' directory to install into")
+    parser.add_argument("--mods-directory", type=Path, help="install the mods here instead of the profile directory")
+    parser.add_argument(
+        "--data-directory",
+        type=Path,
+        help="keep the information cache, file store and partial downloads here between runs"
+    )
+    parser.add_argument("--concurrent-requests", type=int, help="number of information requests made at once")
+    parser.add_argument("--concurrent-downloads", type=int, help="number of files downloaded at once")
+    parser.add_argument(
+        "--adaptive-concurrency",
+        action="store_true",
+        help="start from the numbers above and adjust them to the throughput and errors of the hosts"
+    )
+    parser.add_argument(
+        "--download-mirror",
+        action="append",
+        metavar="TEMPLATE",
+        help="URL template of a host serving CurseForge files, formatted with the two parts of the ID and the name, "
+             "may be given more than once to replace the default mirrors"
+    )
+    parser.add_argument(
+        "--update-lock",
+        type=Path,
+        metavar="MANIFEST",
+        help="resolve every mod again and write the manifest with the updated lock here, instead of installing"
+    )
+    parser.add_argument("--ignore-lock", action="store_true", help="resolve every mod as if the manifest had no lock")
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="hash every installed file after installing, and delete those that do not match"
+    )
+    parser.add_argument("--log-file", type=Path, help="write every log record to this file as JSON lines")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print a line for every mod and file")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print warnings and errors")
+
+    arguments = parser.parse_args(arguments)
+
+    # Caught here, a bad path would otherwise only fail once the work has started on another thread
+    if not arguments.package.is_file():
+        parser.error(f"package does not exist or is not a file: {arguments.package}")
+    elif not zipfile.is_zipfile(arguments.package):
+        parser.error(f"package is not a zip archive: {arguments.package}")
+
+    return arguments
+
+
+def main(arguments=None):
+    arguments = parse_arguments(arguments)
+
+    logger = LogSink.wrap(print)
+
+    if arguments.verbose:
+        logger.level = LogLevel.debug
+    elif arguments.quiet:
+        logger.level = LogLevel.warning
+    else:
+        logger.level = LogLevel.info
+
+    if arguments.log_file:
+        logger.export(arguments.log_file)
+
+    builder = ModpackBuilder(minecraft_directory=arguments.minecraft_directory)
+    builder.logger = logger
+    builder.concurrent_requests = arguments.concurrent_requests or builder.concurrent_requests
+    builder.concurrent_downloads = arguments.concurrent_downloads or builder.concurrent_downloads
+    builder.adaptive_concurrency = arguments.adaptive_concurrency
+    builder.use_lock = not arguments.ignore_lock
+
+    if arguments.download_mirror:
+        builder.download_mirrors = arguments.download_mirror
+
+    cache = None
+
+    if arguments.data_directory:
+        arguments.data_directory.mkdir(parents=True, exist_ok=True)
+
+        cache = CurseForgeCache(arguments.data_directory / "curseforge_cache.db")
+        builder.downloads_directory = arguments.data_directory / "downloads"
+        builder.file_store = FileStore(arguments.data_directory / "files")
+
+    # Ctrl-C is only ever raised in the main thread, so the work is done in another one, and an interrupt aborts
+    # the current task so that it stops its own workers the same way as when it is cancelled from the interface.
+    interrupted = threading.Event()
+
+    def __run():
+        if not builder.load_package(arguments.package) or interrupted.is_set():
+            return None
+
+        if arguments.mods_directory:
+            builder.mods_directory = arguments.mods_directory
+
+        if arguments.update_lock:
+            builder.update_lock(cache=cache)
+
+            if interrupted.is_set():
+                return None
+
+            with open(arguments.update_lock, "w", encoding="utf-8") as manifest_file:
+                json.dump(builder.manifest.dictionary, manifest_file, indent=2)
+
+            failures_ = set(builder.manifest.curseforge_mods.keys()) - set(builder.manifest.lock.keys())
+        else:
+            failures_ = builder.install_mods(cache=cache)
+
+            if arguments.verify and not interrupted.is_set():
+                failures_ |= builder.verify_mods(remove=True)
+
+        if interrupted.is_set():
+            return None
+
+        if cache is not None:
+            cache.update(builder.curseforge_mods)
+
+        return failures_
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(__run)
+
+    try:
+        while True:
+            try:
+                # Waiting without a timeout can't be interrupted on every platform
+                failures = future.result(timeout=0.25)
+                break
+            except concurrent.futures.TimeoutError:
+                continue
+            except (FileNotFoundError, zipfile.BadZipFile) as error:
+                # Such as a package without a manifest, or one that is corrupt past its central directory
+                logger.error(f"Could not load the package:\n{type(error).__name__}: {error}")
+
+                failures = None
+                break
+            except KeyboardInterrupt:
+                interrupted.set()
+                builder.abort()
+
+                logger.warning("Interrupted, waiting for the current task to stop...")
+                logger.flush()
+    finally:
+        executor.shutdown(True)
+
+        if cache is not None:
+            cache.close()
+
+        if builder.file_store:
+            builder.file_store.close()
+
+        logger.close()
+
+    if interrupted.is_set():
+        return 130
+
+    return 1 if failures is None or failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
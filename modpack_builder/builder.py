@@ -1,13 +1,20 @@
 import os
 import math
 import json
+import time
 import shutil
+import asyncio
+import hashlib
+import threading
+import collections
 import concurrent.futures
 
+from enum import Enum
 from pathlib import Path
+from urllib.parse import urlsplit
 from zipfile import ZipFile
 from tempfile import TemporaryDirectory
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 import psutil
 
@@ -15,14 +22,29 @@ import modpack_builder.utilities as utilities
 
 from modpack_builder import PLATFORM
 from modpack_builder.manifest import ModpackManifest
+from modpack_builder.logs import LogSink
+from modpack_builder.store import FileStore
+from modpack_builder.network import ConnectionPool, ConcurrencyController, MirrorSelector, RateLimiter, RetryPolicy
+from modpack_builder.network import parse_retry_after
 from modpack_builder.utilities import ProgressReporter
-from modpack_builder.curseforge import CurseForgeMod, CURSEFORGE_MOD_BASE_URL
+from modpack_builder.curseforge import CurseForgeMod, CurseForgeWidgetBackend
+from modpack_builder.curseforge import CURSEFORGE_API_BASE_URL, CURSEFORGE_MOD_BASE_URL, CURSEFORGE_DOWNLOAD_MIRRORS
 
 
 if PLATFORM == "Windows":
     import winreg
     import win32com.client
 
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class FetchEngine(Enum):
+    threads = "threads"
+    asyncio = "asyncio"
+
 
 class ModpackBuilder:
     # I would love to find a way to make everything below into static,
@@ -34,8 +56,20 @@ class ModpackBuilder:
     max_concurrent_requests = 16
     # Also a default chosen to not put too much stress on the CurseForge mirrors.
     max_concurrent_downloads = 16
-    # Block size for file stream downloads.
-    download_block_size = 1024
+    # Number of resolved files that may wait for a download slot in the install pipeline,
+    # once this many are waiting no more information is requested until the downloads catch up.
+    download_queue_size = 32
+    # Requests per second sent to the CurseForge API, and how many may be sent at once after a quiet period.
+    # Downloads are not limited, but every host is paused for as long as it asks with a 'Retry-After' header.
+    curseforge_api_rate = 20
+    curseforge_api_burst = 40
+    # Block size for file stream downloads, when this is none the block size adapts to the throughput.
+    download_block_size = None
+    # Lists the files that the builder has installed in the mods directory, kept in that same directory,
+    # and only these are ever removed as stale so that jars added by the user are left alone.
+    installed_files_filename = ".installed_files"
+    # Number of package members extracted by a worker before progress is reported.
+    extract_batch_size = 64
     # Generally Minecraft can benefit from extra memory up to a certain point.
     # The value of this is the cap imposed by `ModpackBuilder._get_recommended_memory`,
     # but can be overridden or set to 0 to remove the limit entirely (for example, servers).
@@ -55,22 +89,85 @@ class ModpackBuilder:
     def __init__(self, minecraft_directory=None, minecraft_launcher_path=None, client_allocated_memory=None,
                  server_allocated_memory=None):
         self.__task_aborted = False
+        self.__event_loop = None
+        self.__fetch_task = None
 
-        self.__logger = print
+        # Records are given to the sink in batches, any plain function assigned as the logger is wrapped by one
+        self.__logger = LogSink.wrap(print)
         self.__reporter = ProgressReporter(None)
 
+        # Identifiers with a request or download that has been retried during the current task
+        self.__retried = set()
+
+        # The number of requests and downloads in flight during the current task, see `adaptive_concurrency`
+        self.__request_concurrency = None
+        self.__download_concurrency = None
+
         self.__temporary_directory = TemporaryDirectory()
 
         self.temporary_directory = Path(self.__temporary_directory.name)
 
         self.__package_contents_directory = self.temporary_directory / "extracted"
         self.__package_contents_directory.mkdir()
+        # Threads still deleting old package contents, see `remove_extracted`
+        self.__removal_threads = list()
+
+        # Partial downloads are kept here to be resumed, so this should be somewhere persistent
+        # if downloads are meant to survive between runs of the program.
+        self.downloads_directory = self.temporary_directory / "downloads"
+        # A `FileStore` shared between every profile, files found in it are linked instead of downloaded again
+        self.file_store = None
 
-        self.__downloads_directory = self.temporary_directory / "downloads"
-        self.__downloads_directory.mkdir()
+        # Maps the filename of each member extracted into the directory above to its CRC, size and modification time
+        self.__extracted_members = dict()
 
         self.concurrent_requests = 8
         self.concurrent_downloads = 8
+        # When set, the two numbers above are only where each task starts, and the number of requests and
+        # downloads in flight follows their throughput, latency and errors, up to the maximums of the class.
+        self.adaptive_concurrency = False
+        # Decompression releases the GIL, so extracting the package scales with the number of cores.
+        self.concurrent_extractions = os.cpu_count() or 4
+        # Hashing holds the GIL for small reads, so installed files are verified in a pool of processes.
+        self.concurrent_hashes = os.cpu_count() or 4
+
+        # The asyncio engine can keep hundreds of requests in flight on a single thread,
+        # but depends on the optional 'aiohttp' package. Only `fetch_curseforge_mods` and `update_lock` use it,
+        # the install pipeline hands each response straight to a download and always requests with threads.
+        self.fetch_engine = FetchEngine.threads
+        # Seconds before cached project information is revalidated with a conditional request.
+        self.curseforge_cache_ttl = 60 * 60 * 6
+        # Mods with an entry in the lock of the manifest are installed with the locked file,
+        # and the install pipeline does not request their project information at all.
+        self.use_lock = True
+        # Files already in the mods directory are kept when their size matches, and when this is set,
+        # their hash as well if the lock or the store knows what it should be.
+        self.verify_installed_hashes = False
+        # Jars in the mods directory that are not part of the modpack are deleted after a complete install
+        self.remove_stale_files = True
+
+        # Where the information of each project comes from, the widget API unless another backend is given
+        self.curseforge_backend = CurseForgeWidgetBackend()
+
+        # Shared by the metadata requests and the file downloads so that connections to each host are kept alive
+        # between requests, rather than performing a new handshake for every single identifier.
+        self.connection_pool = ConnectionPool(max(self.concurrent_requests, self.concurrent_downloads))
+        self.connection_pool.rate_limiter = RateLimiter()
+        self.connection_pool.rate_limiter.set_limit(
+            urlsplit(CURSEFORGE_API_BASE_URL).netloc,
+            ModpackBuilder.curseforge_api_rate,
+            ModpackBuilder.curseforge_api_burst
+        )
+
+        # Requests and downloads that fail with a connection error or a status such as 429 or 503
+        # are tried again after a growing delay, before the identifier is counted as a failure.
+        self.retry_policy = RetryPolicy()
+        self.retry_policy.extra_exceptions = (utilities.DownloadException,)
+
+        # URL templates of the hosts that serve CurseForge files, each download goes to whichever is doing best
+        # and is hedged with a request to the next one when it is slow to respond.
+        self.download_mirrors = list(CURSEFORGE_DOWNLOAD_MIRRORS)
+        self.mirror_selector = MirrorSelector()
 
         self.readme_path = None
 
@@ -91,11 +188,17 @@ class ModpackBuilder:
         self.server_allocated_memory = server_allocated_memory or ModpackBuilder.get_recommended_memory(maximum=0)
 
     def __del__(self):
+        self.connection_pool.close()
+
+        # Cleaning up would otherwise delete the same files as any thread that is still running
+        for removal_thread in self.__removal_threads:
+            removal_thread.join()
+
         self.__temporary_directory.cleanup()
 
     def __setattr__(self, name, value):
         if name == "logger":
-            self.__logger = value
+            self.__logger = value if isinstance(value, LogSink) else LogSink.wrap(value)
         elif name == "reporter":
             self.__reporter = value
         else:
@@ -104,7 +207,11 @@ class ModpackBuilder:
     def abort(self):
         self.__task_aborted = True
 
-    def fetch_curseforge_mods(self, skip_identifiers=None):
+        # Abort may be called from any thread, so the cancellation must be scheduled on the loop itself
+        if (event_loop := self.__event_loop) is not None and (fetch_task := self.__fetch_task) is not None:
+            event_loop.call_soon_threadsafe(fetch_task.cancel)
+
+    def fetch_curseforge_mods(self, skip_identifiers=None, cache=None):
         self.curseforge_mods.clear()
 
         identifiers = set(self.manifest.curseforge_mods.keys())
@@ -112,162 +219,948 @@ class ModpackBuilder:
         if skip_identifiers:
             identifiers -= set(skip_identifiers)
 
+        cache = cache if cache is not None else dict()
+
+        self.__logger.phase = "fetch"
         self.__reporter.maximum = len(identifiers)
         self.__reporter.value = 0
-        self.__logger("Retrieving information for all identifiers...")
+        self.__logger.info("Retrieving information for all identifiers...")
 
-        executor = ThreadPoolExecutor(max_workers=self.concurrent_requests)
-        futures = dict()
         failures = list()
+        revalidated = list()
 
-        def __target(identifier_):
-            if self.__task_aborted:
-                return
-
-            return CurseForgeMod.get(identifier_)
+        self.__retried.clear()
 
-        for identifier in identifiers:
-            futures[executor.submit(__target, identifier)] = self.manifest.curseforge_mods[identifier]
+        # Cached entries that are still within the TTL are used without making any request at all,
+        # the rest will be sent with their validators so that unchanged projects are answered with a 304.
+        for identifier in tuple(identifiers):
+            if (entry := cache.get(identifier)) is not None and not entry.is_stale(self.curseforge_cache_ttl):
+                identifiers.remove(identifier)
 
-        for future in concurrent.futures.as_completed(futures):
-            # Abort the loop if the task has been cancelled
-            if self.__task_aborted:
-                break
+                self.curseforge_mods[identifier] = entry
+                self.__reporter.value += 1
 
-            try:
-                # Ensure that the thread returned a value, if it hasn't the task is probably cancelled
-                assert (entry := future.result())
+        if self.curseforge_mods:
+            self.__logger.info(f"Using cached information for {len(self.curseforge_mods)} identifiers.")
 
+        def __on_completed(identifier_, entry=None, error=None):
+            if error is None:
                 self.curseforge_mods[entry.identifier] = entry
 
-                self.__logger(f"Retrieved information: {entry.identifier}")
-            except Exception as error:
-                self.__logger(
-                    f"Request for '{futures[future].identifier}' failed:\n"
-                    f"{type(error).__name__}: {error}"
+                if entry is cache.get(identifier_):
+                    revalidated.append(entry)
+                    self.__logger.debug(
+                        f"Cached information is unchanged: {entry.identifier}", identifier=entry.identifier
+                    )
+                else:
+                    self.__logger.debug(f"Retrieved information: {entry.identifier}", identifier=entry.identifier)
+            else:
+                failures.append(self.manifest.curseforge_mods[identifier_])
+
+                self.__logger.warning(
+                    f"Request for '{identifier_}' failed:\n"
+                    f"{type(error).__name__}: {error}",
+                    identifier=identifier_
                 )
 
             self.__reporter.value += 1
 
-        executor.shutdown(True)
+        if self.fetch_engine is FetchEngine.asyncio:
+            self.__fetch_curseforge_mods_asyncio(identifiers, cache, __on_completed)
+        else:
+            self.__fetch_curseforge_mods_threads(identifiers, cache, __on_completed)
 
         if self.__task_aborted:
             self.__task_aborted = False  # Reset as to not conflict with other tasks
 
             self.curseforge_mods.clear()  # Remove the results that have already been retrieved
 
-            self.__logger("Information retrieval cancelled.")
+            self.__logger.info("Information retrieval cancelled.")
         else:
-            self.__logger("Finished fetching information for all identifiers.")
+            self.__logger.info("Finished fetching information for all identifiers.")
+
+            if revalidated:
+                self.__logger.info(f"Revalidated cached information for {len(revalidated)} identifiers.")
 
             if failures:
-                self.__logger(f"Failed identifiers: {', '.join(entry.identifier for entry in failures)}")
+                self.__logger.warning(f"Failed identifiers: {', '.join(entry.identifier for entry in failures)}")
+
+            self.__log_retries(entry.identifier for entry in failures)
+            self.log_connection_statistics()
 
+        self.__logger.flush()
         self.__reporter.done()
 
+    def __fetch_curseforge_mods_threads(self, identifiers, cache, callback):
+        self.__request_concurrency = self.__concurrency_controller(
+            self.concurrent_requests, ModpackBuilder.max_concurrent_requests
+        )
+
+        self.connection_pool.resize(self.__request_concurrency.maximum)
+
+        # There is a worker for as many requests as there could ever be, each one waits for a slot in the controller
+        executor = ThreadPoolExecutor(max_workers=self.__request_concurrency.maximum)
+        futures = dict()
+
+        for batch in self.__batches(identifiers):
+            futures[executor.submit(self.__fetch_curseforge_batch, batch, cache)] = batch
+
+        for future in concurrent.futures.as_completed(futures):
+            # Abort the loop if the task has been cancelled
+            if self.__task_aborted:
+                break
+
+            for identifier, entry, error in ModpackBuilder.__batch_results(future, futures[future]):
+                callback(identifier, entry=entry, error=error)
+
+        executor.shutdown(True)
+
+    def __batches(self, identifiers):
+        # Each request is for as many identifiers as the backend can answer for at once
+        identifiers = list(identifiers)
+        batch_size = max(self.curseforge_backend.batch_size, 1)
+
+        return [identifiers[index:index + batch_size] for index in range(0, len(identifiers), batch_size)]
+
+    def __fetch_curseforge_batch(self, identifiers, cache):
+        results = dict()
+
+        for attempt in range(self.retry_policy.attempts):
+            if self.__task_aborted:
+                break
+
+            with self.__request_concurrency.slot():
+                start_time = time.monotonic()
+                results.update(
+                    self.curseforge_backend.get_many(identifiers, session=self.connection_pool, cache=cache)
+                )
+                latency = time.monotonic() - start_time
+
+            identifiers, delay = self.__finish_batch_attempt(identifiers, results, attempt, latency)
+
+            if delay is None or not RetryPolicy.sleep(delay, lambda: self.__task_aborted):
+                break
+
+        return results
+
+    def __finish_batch_attempt(self, identifiers, results, attempt, latency):
+        """
+        Count an attempt at a batch with the request concurrency, and return the identifiers that are worth
+        requesting again along with the delay before the next attempt, which is none when there should not be one.
+        Both fetch engines go through this, so that they retry, log and adapt to the host in the same way.
+        """
+        # Only the identifiers that failed in a way that is worth trying again are requested again
+        identifiers = [
+            identifier for identifier in identifiers
+            if isinstance(error := results.get(identifier), Exception) and self.retry_policy.is_retryable(error)
+        ]
+
+        if not identifiers:
+            self.__request_concurrency.record_success(latency)
+            return identifiers, None
+
+        self.__request_concurrency.record_error()
+
+        if attempt + 1 >= self.retry_policy.attempts:
+            return identifiers, None
+
+        delay = max(self.retry_policy.delay(attempt, results[identifier]) for identifier in identifiers)
+
+        for identifier in identifiers:
+            self.__on_retry(identifier, attempt, results[identifier], delay)
+
+        return identifiers, delay
+
+    def __on_retry(self, identifier, attempt, error, delay):
+        self.__retried.add(identifier)
+
+        self.__logger.debug(
+            f"Attempt {attempt + 1} for '{identifier}' failed, trying again in {delay:.1f} seconds:\n"
+            f"{type(error).__name__}: {error}",
+            identifier=identifier
+        )
+
+    def __concurrency_controller(self, limit, maximum):
+        if self.adaptive_concurrency:
+            return ConcurrencyController(limit, maximum=maximum)
+
+        # A controller that can't go above or below the limit is the same as a fixed number of workers
+        return ConcurrencyController(limit, minimum=limit, maximum=limit)
+
+    def __log_retries(self, failures):
+        if not self.__retried:
+            return
+
+        failed_count = len(self.__retried & set(failures))
+
+        self.__logger.info(
+            f"Retried {len(self.__retried)} identifiers, {len(self.__retried) - failed_count} succeeded "
+            f"on a later attempt and {failed_count} failed."
+        )
+
+    @staticmethod
+    def __batch_results(future, identifiers):
+        try:
+            results = future.result()
+        except Exception as error:
+            results = dict.fromkeys(identifiers, error)
+
+        for identifier in identifiers:
+            if isinstance(result := results.get(identifier), CurseForgeMod):
+                yield identifier, result, None
+            else:
+                yield identifier, None, result or LookupError(f"No information was returned for '{identifier}'")
+
+    def __fetch_curseforge_mods_asyncio(self, identifiers, cache, callback):
+        if aiohttp is None:
+            raise RuntimeError("The 'aiohttp' package is required by the asyncio fetch engine")
+
+        self.__request_concurrency = self.__concurrency_controller(
+            self.concurrent_requests, ModpackBuilder.max_concurrent_requests
+        )
+
+        batches = self.__batches(identifiers)
+
+        async def __fetch_all():
+            # Kept so that `abort` can cancel this task from whichever thread it was called on
+            self.__event_loop = asyncio.get_running_loop()
+            self.__fetch_task = asyncio.current_task()
+
+            # Coroutines wait for a slot from the controller rather than for a thread of their own,
+            # so one coroutine per batch can be created up front without any threads at all.
+            connector = aiohttp.TCPConnector(limit=self.__request_concurrency.maximum)
+
+            # The same timeouts as the connection pool, so that a stalled request is retried instead of waited on
+            connect_timeout, read_timeout = self.connection_pool.timeout
+            timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+
+            async with aiohttp.ClientSession(
+                connector=connector, timeout=timeout, trace_configs=self.__trace_configs()
+            ) as session:
+                async def __fetch_batch(batch):
+                    results = dict()
+
+                    for attempt in range(self.retry_policy.attempts):
+                        async with self.__request_concurrency.slot_async():
+                            start_time = time.monotonic()
+                            results.update(
+                                await self.curseforge_backend.get_many_async(batch, session, cache=cache)
+                            )
+                            latency = time.monotonic() - start_time
+
+                        # The slot was given back before the delay, a request waiting to be retried is not in flight
+                        batch, delay = self.__finish_batch_attempt(batch, results, attempt, latency)
+
+                        if delay is None:
+                            break
+
+                        await asyncio.sleep(delay)
+
+                    return results
+
+                tasks = {asyncio.ensure_future(__fetch_batch(batch)): batch for batch in batches}
+                pending = set(tasks)
+
+                try:
+                    while pending and not self.__task_aborted:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                        for task in done:
+                            for identifier, entry, error in ModpackBuilder.__batch_results(task, tasks[task]):
+                                callback(identifier, entry=entry, error=error)
+                except asyncio.CancelledError:
+                    pass
+                finally:
+                    for task in pending:
+                        task.cancel()
+
+                    await asyncio.gather(*pending, return_exceptions=True)
+
+        try:
+            asyncio.run(__fetch_all())
+        finally:
+            self.__event_loop = None
+            self.__fetch_task = None
+
+    def __trace_configs(self):
+        # The session of the asyncio engine does not go through the connection pool, so these hooks do for each of
+        # its requests what `ConnectionPool.get` does, with the URL that the request is actually sent to,
+        # and count them with the pool so that its statistics cover the requests of both engines.
+        rate_limiter = self.connection_pool.rate_limiter
+        trace_config = aiohttp.TraceConfig()
+
+        async def __on_request_start(_, context, parameters):
+            context.new_connection = False
+
+            if rate_limiter is not None:
+                await rate_limiter.acquire_async(str(parameters.url))
+
+        async def __on_connection_create_end(_, context, __):
+            context.new_connection = True
+
+        async def __on_request_end(_, context, parameters):
+            response = parameters.response
+
+            self.connection_pool.record_request(str(parameters.url), new_connection=context.new_connection)
+
+            if rate_limiter is not None and (
+                retry_after := parse_retry_after(response.status, response.headers)
+            ) is not None:
+                rate_limiter.defer(str(parameters.url), retry_after)
+
+        async def __on_request_exception(_, context, parameters):
+            self.connection_pool.record_request(str(parameters.url), new_connection=context.new_connection)
+
+        async def __on_response_chunk_received(_, __, parameters):
+            self.connection_pool.record(str(parameters.url), len(parameters.chunk))
+
+        trace_config.on_request_start.append(__on_request_start)
+        trace_config.on_connection_create_end.append(__on_connection_create_end)
+        trace_config.on_request_end.append(__on_request_end)
+        trace_config.on_request_exception.append(__on_request_exception)
+        trace_config.on_response_chunk_received.append(__on_response_chunk_received)
+
+        return [trace_config]
+
     def find_curseforge_files(self):
-        assert self.curseforge_mods
+        # Identifiers without a locked file or any project information are those that failed to be retrieved
+        identifiers = [
+            identifier for identifier in self.manifest.curseforge_mods
+            if identifier in self.curseforge_mods or self.__locked_file(identifier)
+        ]
+
+        assert identifiers
 
         self.curseforge_files.clear()
 
-        self.__reporter.maximum = len(self.curseforge_mods)
+        self.__logger.phase = "resolve"
+        self.__reporter.maximum = len(identifiers)
         self.__reporter.value = 0
-        self.__logger("Searching for suitable releases for all identifiers...")
+        self.__logger.info("Searching for suitable releases for all identifiers...")
 
         failures = list()
 
-        for entry in self.curseforge_mods.values():
-            version = self.manifest.curseforge_mods[entry.identifier].version
+        for identifier in identifiers:
+            if (file := self.__locked_file(identifier)) is not None:
+                self.__logger.debug(f"Using locked file for '{identifier}': {file.name}", identifier=identifier)
+                self.curseforge_files[identifier] = file
+            elif not self.__resolve_curseforge_file(self.curseforge_mods[identifier]):
+                failures.append(identifier)
 
-            if isinstance(version, int):
-                file = entry.file(version)
-            else:
-                if version is None:
-                    version = self.manifest.release_preference
+            self.__reporter.value += 1
+
+        self.__logger.info("Finished fetching releases for all identifiers.")
+
+        if failures:
+            self.__logger.warning(f"Failed identifiers: {', '.join(failures)}")
+
+        self.__logger.flush()
+        self.__reporter.done()
 
-                file = entry.best_file(self.manifest.game_versions, version)
+    def __locked_file(self, identifier):
+        if not self.use_lock or (locked_file := self.manifest.lock.get(identifier)) is None:
+            return None
+
+        # A lock that disagrees with a file ID pinned in the manifest is out of date, and the manifest wins
+        if isinstance(version := self.manifest.curseforge_mods[identifier].version, int) and version != locked_file.id:
+            return None
+
+        return CurseForgeMod.FileEntry(id=locked_file.id, name=locked_file.name, filesize=locked_file.filesize)
+
+    def update_lock(self, cache=None):
+        """
+        Retrieve and resolve every CurseForge mod again regardless of the current lock, and record the results in it.
+        Returns the identifiers of the mods whose locked file has changed.
+        """
+        use_lock = self.use_lock
+        self.use_lock = False
+
+        try:
+            self.fetch_curseforge_mods(cache=cache)
+
+            if self.curseforge_mods:
+                self.find_curseforge_files()
+        finally:
+            self.use_lock = use_lock
+
+        self.__logger.phase = "lock"
+
+        lock = dict()
+        changed = set()
+
+        for identifier, file in self.curseforge_files.items():
+            previous = self.manifest.lock.get(identifier)
 
-            if file:
-                self.__logger(f"Found '{file.type.value}' file for '{entry.identifier}': {file.name}")
-                self.curseforge_files[entry.identifier] = file
+            # The hash is kept for as long as the file stays the same, or taken from the store if it has the file
+            if previous is not None and previous.id == file.id and previous.sha1:
+                sha1 = previous.sha1
+            elif self.file_store and self.file_store.hash_algorithm == "sha1":
+                sha1 = self.file_store.digest(file.id)
             else:
-                failures.append(entry)
-                self.__logger(f"Could not find suitable release for: {entry.identifier}")
+                sha1 = None
+
+            lock[identifier] = ModpackManifest.LockedFile(
+                identifier=identifier,
+                id=file.id,
+                name=file.name,
+                filesize=file.filesize,
+                sha1=sha1
+            )
 
-            self.__reporter.value += 1
+            if previous is None or previous.id != file.id:
+                changed.add(identifier)
+                self.__logger.debug(f"Locked '{identifier}' to file: {file.name}", identifier=identifier)
 
-        self.__logger("Finished fetching releases for all identifiers.")
+        # A mod that could not be resolved this time keeps its previous entry, rather than being left unlocked
+        for identifier, previous in self.manifest.lock.items():
+            if identifier in self.manifest.curseforge_mods and identifier not in lock:
+                lock[identifier] = previous
 
-        if failures:
-            self.__logger(f"Failed identifiers: {', '.join(entry.identifier for entry in failures)}")
+        self.manifest.lock = lock
 
-        self.__reporter.done()
+        self.__logger.info(f"Updated the lock, {len(changed)} of {len(lock)} locked files have changed.")
+        self.__logger.flush()
+
+        return changed
+
+    def __resolve_curseforge_file(self, entry):
+        version = self.manifest.curseforge_mods[entry.identifier].version
+
+        if isinstance(version, int):
+            file = entry.file(version)
+        else:
+            if version is None:
+                version = self.manifest.release_preference
+
+            file = entry.best_file(self.manifest.game_versions, version)
+
+        if file:
+            self.__logger.debug(
+                f"Found '{file.type.value}' file for '{entry.identifier}': {file.name}",
+                identifier=entry.identifier
+            )
+            self.curseforge_files[entry.identifier] = file
+        else:
+            self.__logger.warning(
+                f"Could not find suitable release for: {entry.identifier}", identifier=entry.identifier
+            )
+
+        return file
 
     def download_curseforge_files(self, reporter_factory=lambda: ProgressReporter()):
         assert self.curseforge_files
 
         self.mods_directory.mkdir(exist_ok=True, parents=True)
+        self.downloads_directory.mkdir(exist_ok=True, parents=True)
 
+        self.__logger.phase = "download"
         self.__reporter.maximum = len(self.curseforge_files)
         self.__reporter.value = 0
-        self.__logger("Downloading all CurseForge files...")
+        self.__logger.info("Downloading all CurseForge files...")
+
+        self.__download_concurrency = self.__concurrency_controller(
+            self.concurrent_downloads, ModpackBuilder.max_concurrent_downloads
+        )
+
+        self.connection_pool.resize(self.__download_concurrency.maximum)
 
-        executor = ThreadPoolExecutor(max_workers=self.concurrent_downloads)
+        executor = ThreadPoolExecutor(max_workers=self.__download_concurrency.maximum)
         futures = dict()
         failures = dict()
+        installed = set()
+
+        self.__retried.clear()
 
         for identifier, file in self.curseforge_files.items():
-            destination = self.__downloads_directory / file.name
+            futures[self.__submit_download(identifier, file, executor, reporter_factory)] = (identifier, file)
 
-            if destination.exists():
-                self.__logger(f"File already exists: {file.name}")
+        for future in concurrent.futures.as_completed(futures):
+            identifier, file = futures[future]
 
-                continue
+            if self.__task_aborted:
+                break
+
+            if self.__finish_download(identifier, file, future):
+                installed.add(identifier)
+            else:
+                failures[identifier] = file
+
+            self.__reporter.value += 1
+
+        executor.shutdown(True)
+
+        if self.__task_aborted:
+            self.__task_aborted = False  # Reset as to not conflict with other tasks
+
+            self.__logger.info("Downloads cancelled, partial files will be resumed next time.")
+
+            # Files already in place are recorded all the same, or they could never be removed once they are stale
+            self.__record_installed_files(installed | ModpackBuilder.__installed_by_workers(futures))
+        else:
+            self.__logger.info("Finished downloading all CurseForge files...")
+
+            if failures:
+                self.__logger.warning(f"Failed downloads: {', '.join(file.name for file in failures.values())}")
+            elif self.remove_stale_files:
+                self.remove_stale_mods()
+
+            self.__record_installed_files(installed)
+
+            self.__log_retries(failures.keys())
+
+        self.log_connection_statistics()
+
+        self.__logger.flush()
+        self.__reporter.done()
+
+    def __install_existing_file(self, identifier, file):
+        """
+        Install the file from the store or the downloads directory if it is already in either of them,
+        returning false if it has to be downloaded.
+        """
+        if self.__is_installed(identifier, file):
+            self.__logger.debug(f"File already installed: {file.name}", identifier=identifier)
+            return True
+
+        if self.file_store and self.file_store.link(file.id, self.mods_directory / file.name):
+            self.__logger.debug(f"Linked '{identifier}' file from the store: {file.name}", identifier=identifier)
+            return True
+
+        if (destination := self.__download_path(file)).exists():
+            try:
+                self.__install_downloaded_file(identifier, file, destination)
+            except utilities.DownloadException as error:
+                self.__logger.warning(f"Discarding downloaded file '{file.name}': {error}", identifier=identifier)
+                return False
+
+            self.__logger.debug(f"File already downloaded: {file.name}", identifier=identifier)
+            return True
+
+        return False
+
+    def __is_installed(self, identifier, file):
+        try:
+            installed_size = (installed_path := self.mods_directory / file.name).stat().st_size
+        except FileNotFoundError:
+            return False
+
+        if file.filesize is not None and installed_size != file.filesize:
+            return False
+
+        if self.verify_installed_hashes and (expected_sha1 := self.__expected_sha1(identifier, file)):
+            return FileStore.hash_file(installed_path, "sha1") == expected_sha1
+
+        return True
+
+    def __expected_sha1(self, identifier, file):
+        if (locked_file := self.manifest.lock.get(identifier)) is not None and locked_file.id == file.id:
+            if locked_file.sha1:
+                return locked_file.sha1
+
+        if self.file_store and self.file_store.hash_algorithm == "sha1":
+            return self.file_store.digest(file.id)
+
+        return None
+
+    def verify_mods(self, remove=False):
+        """
+        Check every resolved CurseForge file in the mods directory against its size and known SHA-1,
+        hashing them in a pool of processes, and return the identifiers of the files that are missing or wrong.
+        """
+        self.__logger.phase = "verify"
+        self.__reporter.maximum = len(self.curseforge_files)
+        self.__reporter.value = 0
+        self.__logger.info("Verifying installed CurseForge files...")
+
+        failures = set()
+        expected_hashes = dict()
+
+        for identifier, file in self.curseforge_files.items():
+            try:
+                installed_size = (installed_path := self.mods_directory / file.name).stat().st_size
+            except FileNotFoundError:
+                failures.add(identifier)
+                self.__logger.warning(f"File is not installed: {file.name}", identifier=identifier)
+            else:
+                if file.filesize is not None and installed_size != file.filesize:
+                    failures.add(identifier)
+                    self.__logger.warning(f"Size of the installed file is wrong: {file.name}", identifier=identifier)
+                elif expected_sha1 := self.__expected_sha1(identifier, file):
+                    expected_hashes[identifier] = (installed_path, expected_sha1)
+                    continue
+
+            self.__reporter.value += 1
+
+        if expected_hashes:
+            with ProcessPoolExecutor(max_workers=self.concurrent_hashes) as executor:
+                futures = {
+                    executor.submit(FileStore.hash_file, installed_path, "sha1"): identifier
+                    for identifier, (installed_path, _) in expected_hashes.items()
+                }
+
+                for future in concurrent.futures.as_completed(futures):
+                    installed_path, expected_sha1 = expected_hashes[identifier := futures[future]]
+
+                    if future.result() != expected_sha1:
+                        failures.add(identifier)
+                        self.__logger.warning(
+                            f"Hash of the installed file is wrong: {installed_path.name}", identifier=identifier
+                        )
+                    else:
+                        self.__logger.debug(f"Verified file: {installed_path.name}", identifier=identifier)
+
+                    self.__reporter.value += 1
+
+        # Whatever is left in place of a wrong file would only be mistaken for the right one later
+        if remove:
+            for identifier in failures:
+                (self.mods_directory / self.curseforge_files[identifier].name).unlink(missing_ok=True)
+
+        self.__logger.info(
+            f"Verified {len(self.curseforge_files)} files, {len(expected_hashes)} of them by hash, "
+            f"{len(failures)} are missing or wrong."
+        )
+
+        self.__logger.flush()
+        self.__reporter.done()
+
+        return failures
+
+    def remove_stale_mods(self):
+        """
+        Delete every file that the builder has installed in the mods directory
+        which is neither a resolved CurseForge file nor an external mod.
+        """
+        # Without a file for every mod, the jar of one that failed could not be told apart from a stale one
+        if not set(self.manifest.curseforge_mods.keys()) <= set(self.curseforge_files.keys()):
+            self.__logger.info("Not every mod was resolved, stale files are kept.")
+            return 0
+
+        expected_names = set(file.name for file in self.curseforge_files.values())
+        expected_names.update(entry.file for entry in self.manifest.external_mods.values() if entry.file)
+
+        installed_names = self.__read_installed_files()
+        removed_count = 0
+
+        for name in sorted(installed_names - expected_names):
+            if (path := self.mods_directory / name).is_file():
+                self.__logger.debug(f"Removing stale file: {name}")
+                path.unlink()
+                removed_count += 1
+
+        self.__write_installed_files(installed_names & expected_names)
+
+        if removed_count:
+            self.__logger.info(f"Removed {removed_count} stale files from the mods directory.")
+
+        return removed_count
+
+    def __read_installed_files(self):
+        try:
+            text = (self.mods_directory / ModpackBuilder.installed_files_filename).read_text("utf-8")
+        except FileNotFoundError:
+            return set()
+
+        # Only bare names are trusted, anything else could point outside of the mods directory
+        return set(name for name in text.splitlines() if name and Path(name).name == name)
+
+    def __write_installed_files(self, names):
+        (self.mods_directory / ModpackBuilder.installed_files_filename).write_text(
+            "".join(f"{name}\n" for name in sorted(names)), "utf-8"
+        )
+
+    def __record_installed_files(self, identifiers):
+        # Names are only ever added here, the old ones are forgotten once they have been removed as stale
+        self.__write_installed_files(self.__read_installed_files() | set(
+            self.curseforge_files[identifier].name for identifier in identifiers
+        ))
+
+    @staticmethod
+    def __installed_by_workers(futures):
+        """
+        Identifiers of the files that a download worker found already in place and installed by itself,
+        which includes those that finished after their results were no longer being handled.
+        """
+        return set(
+            identifier for future, (identifier, _) in futures.items()
+            if future.done() and not future.cancelled() and future.exception() is None and future.result() is None
+        )
+
+    def __submit_download(self, identifier, file, executor, reporter_factory):
+        def __attempt(reporter):
+            # The file is hashed as it is written, so verifying it and adding it to the store never reads it again.
+            # Each attempt resumes the partial file, which the new hasher reads back before the rest is received.
+            hasher = hashlib.sha1()
+
+            path = utilities.download_as_stream(
+                file.download_urls(self.download_mirrors),
+                self.__download_path(file),
+                reporter=reporter,
+                block_size=ModpackBuilder.download_block_size,
+                session=self.connection_pool,
+                resume=True,
+                aborted=lambda: self.__task_aborted,
+                hasher=hasher,
+                mirrors=self.mirror_selector
+            )
+
+            return path, hasher.hexdigest()
+
+        def __measured_attempt(reporter):
+            with self.__download_concurrency.slot():
+                start_time = time.monotonic()
+                path, sha1 = __attempt(reporter)
+                self.__download_concurrency.record_success(time.monotonic() - start_time, path.stat().st_size)
+
+            return path, sha1
+
+        def __on_retry(attempt, error, delay):
+            self.__download_concurrency.record_error()
+            self.__on_retry(identifier, attempt, error, delay)
+
+        def __target():
+            # A file that is already installed, stored or downloaded is checked on the worker as well, so that a long
+            # run of them never holds up the submission of the downloads behind them, and gets no progress bar.
+            if self.__install_existing_file(identifier, file):
+                return None
 
             reporter = reporter_factory()
             reporter.maximum = 0
             reporter.value = 1
 
-            futures[executor.submit(
-                utilities.download_as_stream,
-                file.download,
-                destination,
-                reporter=reporter,
-                block_size=ModpackBuilder.download_block_size
-            )] = (identifier, file)
+            return self.retry_policy.call(
+                __measured_attempt, reporter, aborted=lambda: self.__task_aborted, on_retry=__on_retry
+            )
 
-        for future, in concurrent.futures.as_completed(futures):
-            identifier, file = futures[future]
+        return executor.submit(__target)
 
-            try:
-                path = future.result()
-                # Apparently 'shutil' doesn't support path-like objects (yet?)
-                # so the source path must be changed to a string.
-                shutil.move(str(path), str(self.mods_directory / file.name))
-                self.__logger(f"Downloaded '{identifier}' file: {path.name}")
-            except Exception as error:
-                self.__logger(
-                    f"Download for '{futures[future].identifier}' failed:\n"
-                    f"{type(error).__name__}: {error}"
-                )
+    def __download_path(self, file):
+        # The ID is part of the name so that a partial file is never resumed with the data of a different file
+        return self.downloads_directory / f"{file.id}-{file.name}"
 
+    def __finish_download(self, identifier, file, future):
+        try:
+            # There is no result when the file was already there
+            if (result := future.result()) is None:
+                return True
+
+            self.__install_downloaded_file(identifier, file, *result)
+            self.__logger.debug(f"Downloaded '{identifier}' file: {file.name}", identifier=identifier)
+        except Exception as error:
+            self.__logger.warning(
+                f"Download for '{identifier}' failed:\n"
+                f"{type(error).__name__}: {error}",
+                identifier=identifier
+            )
+            return False
+
+        return True
+
+    def install_curseforge_mods(self, cache=None, reporter_factory=lambda: ProgressReporter()):
+        """
+        Retrieve, resolve and download every CurseForge mod in the manifest as a single pipeline,
+        where the download of each file starts as soon as the information for its mod has arrived.
+        The requests are always made with threads, regardless of the fetch engine.
+        Returns the set of identifiers that could not be installed.
+        """
+        self.curseforge_mods.clear()
+        self.curseforge_files.clear()
+
+        identifiers = set(self.manifest.curseforge_mods.keys())
+        cache = cache if cache is not None else dict()
+
+        self.mods_directory.mkdir(exist_ok=True, parents=True)
+        self.downloads_directory.mkdir(exist_ok=True, parents=True)
+
+        self.__logger.phase = "install"
+        self.__reporter.maximum = len(identifiers)
+        self.__reporter.value = 0
+        self.__logger.info("Installing all CurseForge mods...")
+
+        self.__request_concurrency = self.__concurrency_controller(
+            self.concurrent_requests, ModpackBuilder.max_concurrent_requests
+        )
+        self.__download_concurrency = self.__concurrency_controller(
+            self.concurrent_downloads, ModpackBuilder.max_concurrent_downloads
+        )
+
+        # Both stages share the pool, so it must hold the connections of every request and download in flight
+        self.connection_pool.resize(self.__request_concurrency.maximum + self.__download_concurrency.maximum)
+
+        request_executor = ThreadPoolExecutor(max_workers=self.__request_concurrency.maximum)
+        download_executor = ThreadPoolExecutor(max_workers=self.__download_concurrency.maximum)
+
+        # Identifiers still to be requested, and resolved files waiting for a download slot
+        request_queue = collections.deque()
+        download_queue = collections.deque()
+        # Futures that have been submitted and not yet handled, each stage never has more than its own limit
+        request_futures = dict()
+        download_futures = dict()
+        failures = set()
+        installed = set()
+
+        self.__retried.clear()
+
+        batch_size = max(self.curseforge_backend.batch_size, 1)
+
+        start_time = time.perf_counter()
+        requests_finished_at = start_time
+
+        def __on_resolved(identifier_, file):
+            if file is not None:
+                download_queue.append((identifier_, file))
+                return
+
+            failures.add(identifier_)
             self.__reporter.value += 1
 
-        self.__logger("Finished downloading all CurseForge files...")
+        def __on_retrieved(entry):
+            self.curseforge_mods[entry.identifier] = entry
 
-        if failures:
-            self.__logger(f"Failed downloads: {', '.join(file.name for file in failures.values())}")
+            __on_resolved(entry.identifier, self.__resolve_curseforge_file(entry))
+
+        def __submit():
+            while download_queue and len(download_futures) < self.__download_concurrency.limit:
+                identifier_, file = download_queue.popleft()
+                future = self.__submit_download(identifier_, file, download_executor, reporter_factory)
+                download_futures[future] = (identifier_, file)
+
+            # Requests are held back while the downloads are falling behind, there is no use in resolving
+            # more files than can be downloaded, and the bandwidth is better spent on the downloads.
+            while (
+                request_queue and
+                len(request_futures) < self.__request_concurrency.limit and
+                len(download_queue) < self.download_queue_size
+            ):
+                batch = [request_queue.popleft() for _ in range(min(batch_size, len(request_queue)))]
+                request_futures[request_executor.submit(self.__fetch_curseforge_batch, batch, cache)] = batch
+
+        locked_count = 0
+
+        for identifier in identifiers:
+            if (file := self.__locked_file(identifier)) is not None:
+                locked_count += 1
+                self.curseforge_files[identifier] = file
+                __on_resolved(identifier, file)
+            elif (entry := cache.get(identifier)) is not None and not entry.is_stale(self.curseforge_cache_ttl):
+                __on_retrieved(entry)
+            else:
+                request_queue.append(identifier)
+
+        if locked_count:
+            self.__logger.info(f"Using locked files for {locked_count} identifiers.")
+
+        __submit()
+
+        while (request_futures or download_futures) and not self.__task_aborted:
+            done, _ = concurrent.futures.wait(
+                set(request_futures) | set(download_futures),
+                return_when=concurrent.futures.FIRST_COMPLETED
+            )
+
+            for future in done:
+                if future in download_futures:
+                    identifier, file = download_futures.pop(future)
+
+                    if self.__finish_download(identifier, file, future):
+                        installed.add(identifier)
+                    else:
+                        failures.add(identifier)
+
+                    self.__reporter.value += 1
+                    continue
+
+                batch = request_futures.pop(future)
+
+                if not request_futures and not request_queue:
+                    requests_finished_at = time.perf_counter()
 
+                for identifier, entry, error in ModpackBuilder.__batch_results(future, batch):
+                    if error is not None:
+                        failures.add(identifier)
+                        self.__reporter.value += 1
+
+                        self.__logger.warning(
+                            f"Request for '{identifier}' failed:\n"
+                            f"{type(error).__name__}: {error}",
+                            identifier=identifier
+                        )
+                        continue
+
+                    self.__logger.debug(f"Retrieved information: {identifier}", identifier=identifier)
+                    __on_retrieved(entry)
+
+            __submit()
+
+        request_executor.shutdown(True)
+        download_executor.shutdown(True)
+
+        if self.__task_aborted:
+            self.__task_aborted = False  # Reset as to not conflict with other tasks
+
+            self.__logger.info("Installation cancelled, partial files will be resumed next time.")
+
+            self.__record_installed_files(installed | ModpackBuilder.__installed_by_workers(download_futures))
+        else:
+            self.__logger.info(
+                f"Finished installing {len(identifiers) - len(failures)} CurseForge mods in "
+                f"{time.perf_counter() - start_time:.2f} seconds, "
+                f"the last information request finished after {requests_finished_at - start_time:.2f} seconds."
+            )
+
+            if failures:
+                self.__logger.warning(f"Failed identifiers: {', '.join(sorted(failures))}")
+            elif self.remove_stale_files:
+                self.remove_stale_mods()
+
+            self.__record_installed_files(installed)
+
+            self.__log_retries(failures)
+
+        self.log_connection_statistics()
+
+        self.__logger.flush()
         self.__reporter.done()
 
+        return failures
+
+    def __install_downloaded_file(self, identifier, file, path, sha1=None):
+        if expected_sha1 := self.__expected_sha1(identifier, file):
+            sha1 = sha1 or FileStore.hash_file(path, "sha1")
+
+            # The file is corrupt or not the one that was locked, either way it must be downloaded again
+            if sha1 != expected_sha1:
+                path.unlink()
+
+                raise utilities.DownloadException(f"SHA-1 of the file is {sha1}, expected {expected_sha1}")
+
+        if self.file_store:
+            # The store takes the file, and the profile gets a link to it
+            self.file_store.add(
+                file.id,
+                path,
+                name=file.name,
+                digest=sha1 if self.file_store.hash_algorithm == "sha1" else None
+            )
+            self.file_store.link(file.id, self.mods_directory / file.name)
+        else:
+            # A file that failed verification may still be in the way, and renaming over it fails on Windows
+            (self.mods_directory / file.name).unlink(missing_ok=True)
+
+            # Apparently 'shutil' doesn't support path-like objects (yet?)
+            # so the source path must be changed to a string.
+            shutil.move(str(path), str(self.mods_directory / file.name))
+
     def add_curseforge_mod(self, identifier):
         try:
-            curseforge_mod = CurseForgeMod.get(identifier)
+            curseforge_mod = self.curseforge_backend.get(identifier, session=self.connection_pool)
         except Exception as error:
-            self.__logger(
+            self.__logger.warning(
                 f"Request for '{identifier}' failed:\n"
-                f"{type(error).__name__}: {error}"
+                f"{type(error).__name__}: {error}",
+                identifier=identifier
             )
+            self.__logger.flush()
             return False
 
         curseforge_file = curseforge_mod.best_file(
@@ -276,7 +1169,8 @@ class ModpackBuilder:
         )
 
         if curseforge_file is None:
-            self.__logger(f"Could not find suitable release for: {identifier}")
+            self.__logger.warning(f"Could not find suitable release for: {identifier}", identifier=identifier)
+            self.__logger.flush()
             return False
 
         self.manifest.curseforge_mods[identifier] = ModpackManifest.CurseForgeMod(
@@ -291,10 +1185,21 @@ class ModpackBuilder:
 
         return True
 
-    def install_mods(self):
-        self.fetch_curseforge_mods()
-        self.find_curseforge_files()
-        self.download_curseforge_files()
+    def log_connection_statistics(self):
+        for line in self.connection_pool.report():
+            self.__logger.info(f"Connection statistics for {line}")
+
+        for line in self.mirror_selector.report():
+            self.__logger.info(f"Mirror statistics for {line}")
+
+        if self.__request_concurrency and self.__request_concurrency.adaptive:
+            self.__logger.info(f"Concurrent requests: {self.__request_concurrency.report()}")
+
+        if self.__download_concurrency and self.__download_concurrency.adaptive:
+            self.__logger.info(f"Concurrent downloads: {self.__download_concurrency.report()}")
+
+    def install_mods(self, cache=None):
+        return self.install_curseforge_mods(cache=cache)
 
     def install_modpack(self):
         pass
@@ -311,57 +1216,270 @@ class ModpackBuilder:
     def dump_manifest(self):
         pass
 
-    def remove_extracted(self):
-        if not (contents := tuple(self.__package_contents_directory.glob("**/*"))):
-            return
+    def remove_extracted(self, background=False, verbose=False):
+        # Directory members are not counted, since every file is reported once its directory has been emptied
+        expected_file_count = sum(not filename.endswith("/") for filename in self.__extracted_members)
+        self.__extracted_members.clear()
+
+        if background:
+            # The contents are moved aside and replaced by an empty directory, which is a single rename,
+            # so that the next extraction can begin right away while the old contents are deleted in a thread.
+            removal_directory = self.temporary_directory / f"removed-{utilities.generate_id()}"
+            self.__package_contents_directory.rename(removal_directory)
+            self.__package_contents_directory.mkdir()
+
+            removal_thread = threading.Thread(
+                target=self.__remove_tree_in_background,
+                args=(removal_directory,),
+                daemon=True
+            )
+            removal_thread.start()
+
+            self.__removal_threads = [thread for thread in self.__removal_threads if thread.is_alive()]
+            self.__removal_threads.append(removal_thread)
+
+            return removal_thread
 
-        self.__reporter.maximum = len(contents)
+        # Progress is indeterminate when nothing is known about the previous contents
+        self.__logger.phase = "remove"
+        self.__reporter.maximum = expected_file_count
         self.__reporter.value = 0
-        self.__logger("Deleting previous package contents...")
+        self.__logger.info("Deleting previous package contents...")
+
+        def __on_directory_removed(removed_file_count):
+            self.__reporter.value = min(removed_file_count, expected_file_count)
+
+        file_count, directory_count = self.__remove_tree(
+            self.__package_contents_directory,
+            logger=self.__logger if verbose else None,
+            progress=__on_directory_removed
+        )
+
+        self.__logger.info(
+            f"Finished removing previous package contents: {file_count} files, {directory_count} directories."
+        )
+        self.__logger.flush()
+        self.__reporter.done()
+
+        return None
+
+    def __remove_tree_in_background(self, root):
+        try:
+            file_count, directory_count = self.__remove_tree(root, remove_root=True)
+        except OSError as exception:
+            self.__logger.warning(f"Failed to delete previous package contents '{root}': {exception}")
+        else:
+            self.__logger.debug(
+                f"Finished removing previous package contents: {file_count} files, {directory_count} directories."
+            )
 
+    @staticmethod
+    def __remove_tree(root, logger=None, remove_root=False, progress=None):
+        file_count = 0
         directories = list()
+        pending = [root]
 
-        for item_path in contents:
-            if item_path.is_file():
-                self.__logger(f"Deleting file: {item_path.relative_to(self.__package_contents_directory)}")
-                item_path.unlink()
-                self.__reporter.value += 1
-            elif item_path.is_dir():
-                directories.append(item_path)
+        # Directory entries from `os.scandir` already know their own type, so no item needs an extra stat call
+        while pending:
+            directories.append(directory := pending.pop())
 
-        for directory in reversed(directories):
-            self.__logger(f"Removing directory: {directory.relative_to(self.__package_contents_directory)}")
-            directory.rmdir()
-            self.__reporter.value += 1
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                        continue
 
-        self.__logger("Finished removing previous package contents.")
-        self.__reporter.done()
+                    if logger:
+                        logger.debug(f"Deleting file: {os.path.relpath(entry.path, root)}")
+
+                    os.unlink(entry.path)
+                    file_count += 1
+
+            if progress:
+                progress(file_count)
+
+        # Every directory was listed before any of its children, so the reverse order removes children first
+        for directory in reversed(directories[0 if remove_root else 1:]):
+            if logger:
+                logger.debug(f"Removing directory: {os.path.relpath(directory, root)}")
+
+            os.rmdir(directory)
+
+        return file_count, len(directories) - (0 if remove_root else 1)
 
     def extract_package(self, path):
-        self.__logger(f"Reading package contents: {path.name}")
+        self.__logger.phase = "extract"
+        self.__logger.info(f"Reading package contents: {path.name}")
         self.__reporter.maximum = 1
         self.__reporter.value = 0
 
+        # Reading the central directory is all that is needed to know which members have changed since the last load
         with ZipFile(path, "r") as package_zip:
             package_info_list = package_zip.infolist()
 
-            self.__reporter.maximum = len(package_info_list)
-            self.__logger(f"Extracting package to: {self.__package_contents_directory}")
+        package_members = {
+            member_info.filename: (member_info.CRC, member_info.file_size, member_info.date_time)
+            for member_info in package_info_list
+        }
 
-            for member_info in package_info_list:
-                self.__logger(f"Extracting member: {member_info.filename}")
-                self.__reporter.value += 1
-
-                package_zip.extract(member_info, self.__package_contents_directory)
+        removed_members = [filename for filename in self.__extracted_members if filename not in package_members]
+        changed_members = [
+            member_info for member_info in package_info_list
+            if self.__extracted_members.get(member_info.filename) != package_members[member_info.filename]
+        ]
 
-            self.__logger("Done extracting package!")
+        if not removed_members and not changed_members:
+            self.__logger.info("Package contents are unchanged, nothing to extract.")
+            self.__logger.flush()
             self.__reporter.done()
+            return True
+
+        # When not a single member is left as it was, this is a different package altogether, and the old contents
+        # are moved aside to be deleted in the background instead of holding up the extraction member by member.
+        if self.__extracted_members and len(changed_members) == len(package_info_list):
+            self.__logger.info("Package has nothing in common with the previous one, removing its contents...")
+            self.remove_extracted(background=True)
+        else:
+            self.__remove_extracted_members(removed_members, package_members)
+
+        # Members that are about to be replaced are forgotten first, so that an interrupted extraction
+        # leaves them to be extracted again on the next load rather than being mistaken as up to date.
+        for member_info in changed_members:
+            self.__extracted_members.pop(member_info.filename, None)
+
+        self.__reporter.maximum = len(changed_members)
+        self.__logger.info(
+            f"Extracting {len(changed_members)} of {len(package_info_list)} members to: "
+            f"{self.__package_contents_directory}"
+        )
+
+        # Every directory is created before any worker starts, otherwise two workers extracting members
+        # into the same new directory could both try to create it.
+        directories = set()
+
+        for member_info in changed_members:
+            member_path = utilities.zip_member_path(member_info.filename)
+
+            if member_info.is_dir():
+                directories.add(member_path)
+                self.__extracted_members[member_info.filename] = package_members[member_info.filename]
+            elif member_path.parent != Path():
+                directories.add(member_path.parent)
+
+        for directory in sorted(directories):
+            (self.__package_contents_directory / directory).mkdir(parents=True, exist_ok=True)
+
+        # Members are split into batches so that progress is reported once per batch rather than once per member,
+        # and the largest members go first so that no worker is left with a single large file at the very end.
+        members = sorted(
+            (member_info for member_info in changed_members if not member_info.is_dir()),
+            key=lambda member_info_: member_info_.file_size,
+            reverse=True
+        )
+        batches = [
+            members[index:index + ModpackBuilder.extract_batch_size]
+            for index in range(0, len(members), ModpackBuilder.extract_batch_size)
+        ]
+
+        self.__reporter.value = len(changed_members) - len(members)
+
+        # A `ZipFile` keeps a single file position, so each worker thread opens the package for itself
+        handles = list()
+        local = threading.local()
+
+        def __target(batch_):
+            if self.__task_aborted:
+                return tuple()
+
+            if (package_zip_ := getattr(local, "package_zip", None)) is None:
+                package_zip_ = local.package_zip = ZipFile(path, "r")
+                handles.append(package_zip_)
+
+            for member_info_ in batch_:
+                package_zip_.extract(member_info_, self.__package_contents_directory)
+
+            return batch_
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrent_extractions)
+        futures = [executor.submit(__target, batch) for batch in batches]
+
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                if self.__task_aborted:
+                    break
+
+                for member_info in (batch := future.result()):
+                    self.__extracted_members[member_info.filename] = package_members[member_info.filename]
+
+                self.__reporter.value += len(batch)
+                self.__logger.debug(f"Extracted {self.__reporter.value} of {len(changed_members)} members")
+        finally:
+            executor.shutdown(True)
+
+            for package_zip in handles:
+                package_zip.close()
+
+        completed = not self.__task_aborted
+
+        if completed:
+            self.__logger.info("Done extracting package!")
+        else:
+            self.__task_aborted = False  # Reset as to not conflict with other tasks
+
+            # Members that were not extracted are still missing from the record, and will be extracted next time
+            self.__logger.info("Extraction cancelled.")
+
+        self.__logger.flush()
+        self.__reporter.done()
+
+        return completed
+
+    def __remove_extracted_members(self, filenames, package_members):
+        if not filenames:
+            return
+
+        self.__logger.info(f"Removing {len(filenames)} members that are no longer in the package...")
+
+        directories = set()
+
+        for filename in filenames:
+            del self.__extracted_members[filename]
+
+            member_path = self.__package_contents_directory / utilities.zip_member_path(filename)
+
+            if member_path.is_dir():
+                directories.add(member_path)
+            else:
+                member_path.unlink(missing_ok=True)
+                directories.add(member_path.parent)
+
+        # Directories that are left empty are removed as well, unless the new package still has them as members
+        kept_directories = set(
+            self.__package_contents_directory / utilities.zip_member_path(filename)
+            for filename in package_members
+            if filename.endswith("/")
+        )
+
+        for directory in sorted(directories, key=lambda directory_: len(directory_.parts), reverse=True):
+            while (
+                directory != self.__package_contents_directory and
+                directory not in kept_directories and
+                directory.is_dir() and
+                not any(directory.iterdir())
+            ):
+                directory.rmdir()
+                directory = directory.parent
 
     def load_package(self, path):
-        self.remove_extracted()
-        self.extract_package(path)
+        """
+        Extract the package and load its manifest, returning false if the extraction was cancelled.
+        """
+        # Only the members that differ from what was extracted for the previous package are touched
+        if not self.extract_package(path):
+            return False
 
-        self.__logger("Loading package manifest...")
+        self.__logger.phase = "load"
+        self.__logger.info("Loading package manifest...")
 
         with open(self.__package_contents_directory / "manifest.json", "r") as manifest_file:
             self.manifest = ModpackManifest(json.load(manifest_file))
@@ -371,12 +1489,16 @@ class ModpackBuilder:
                 continue
 
             if file_path.stem.lower() == "readme" and file_path.suffix.lower() in self.markdown_file_extensions:
-                self.__logger(f"Found README file: {file_path.name}")
+                self.__logger.info(f"Found README file: {file_path.name}")
                 self.readme_path = file_path
 
                 break
         else:
-            self.__logger("No README file found in package!")
+            self.__logger.info("No README file found in package!")
+
+        self.__logger.flush()
+
+        return True
 
     def export_package(self):
         pass
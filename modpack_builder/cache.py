@@ -0,0 +1,159 @@
+import copy
+import pickle
+import sqlite3
+import threading
+
+
+class CurseForgeCache:
+    # The description is the bulk of every response and is never needed again after the first load,
+    # so it is dropped from the stored copy unless this is disabled.
+    purge_descriptions = True
+
+    def __init__(self, path=None):
+        self.__lock = threading.RLock()
+        self.__connection = None
+        self.__path = None
+        # Only the entries that have been asked for are ever unpickled, and they are kept here afterwards
+        self.__entries = dict()
+        # The retrieval time of each entry as it was last stored, so that unchanged entries are not written again
+        self.__stored_at = dict()
+
+        if path:
+            self.open(path)
+
+    def open(self, path):
+        with self.__lock:
+            self.close()
+
+            # The connection is shared between the loading thread, the builder thread and the GUI thread,
+            # every use of it is serialized by the lock above.
+            self.__connection = sqlite3.connect(str(path), isolation_level=None, check_same_thread=False)
+            self.__path = path
+
+            self.__connection.execute("PRAGMA journal_mode = WAL")
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS curseforge_mods ("
+                "identifier TEXT PRIMARY KEY, "
+                "retrieved_at REAL, "
+                "data BLOB NOT NULL"
+                ")"
+            )
+
+    def close(self):
+        with self.__lock:
+            if self.__connection:
+                self.__connection.close()
+
+            self.__connection = None
+            self.__path = None
+            self.__entries.clear()
+            self.__stored_at.clear()
+
+    def get(self, identifier, default=None):
+        with self.__lock:
+            if (entry := self.__entries.get(identifier)) is not None:
+                return entry
+
+            if not self.__connection:
+                return default
+
+            row = self.__connection.execute(
+                "SELECT retrieved_at, data FROM curseforge_mods WHERE identifier = ?", (identifier,)
+            ).fetchone()
+
+            if row is None:
+                return default
+
+            try:
+                entry = self.__entries[identifier] = pickle.loads(row[1])
+                self.__stored_at[identifier] = row[0]
+            except Exception:
+                # A row that can no longer be unpickled is as good as missing, it will be replaced on the next fetch
+                self.__delete(identifier)
+                return default
+
+            return entry
+
+    def update(self, entries):
+        with self.__lock:
+            if not self.__connection:
+                self.__entries.update(entries)
+                return
+
+            entries = dict(entries)
+            rows = list()
+
+            for identifier, entry in entries.items():
+                retrieved_at = entry.retrieved_at.timestamp() if entry.retrieved_at else None
+
+                if (
+                    self.__entries.get(identifier) is entry and
+                    identifier in self.__stored_at and
+                    self.__stored_at[identifier] == retrieved_at
+                ):
+                    continue
+
+                rows.append((identifier, retrieved_at, self.__serialize(entry)))
+
+            if rows:
+                # All of the rows are written in one transaction, either every one of them is stored or none are
+                with self.__connection:
+                    self.__connection.execute("BEGIN")
+                    self.__connection.executemany(
+                        "INSERT OR REPLACE INTO curseforge_mods (identifier, retrieved_at, data) VALUES (?, ?, ?)",
+                        rows
+                    )
+
+            self.__entries.update(entries)
+            self.__stored_at.update((row[0], row[1]) for row in rows)
+
+    def keys(self):
+        with self.__lock:
+            if not self.__connection:
+                return set(self.__entries.keys())
+
+            return set(row[0] for row in self.__connection.execute("SELECT identifier FROM curseforge_mods"))
+
+    def __getitem__(self, identifier):
+        if (entry := self.get(identifier)) is None:
+            raise KeyError(identifier)
+
+        return entry
+
+    def __setitem__(self, identifier, entry):
+        self.update({identifier: entry})
+
+    def __delitem__(self, identifier):
+        with self.__lock:
+            self.__delete(identifier)
+
+    def __contains__(self, identifier):
+        return self.get(identifier) is not None
+
+    def __len__(self):
+        with self.__lock:
+            if not self.__connection:
+                return len(self.__entries)
+
+            return self.__connection.execute("SELECT COUNT(*) FROM curseforge_mods").fetchone()[0]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __delete(self, identifier):
+        self.__entries.pop(identifier, None)
+        self.__stored_at.pop(identifier, None)
+
+        if self.__connection:
+            self.__connection.execute("DELETE FROM curseforge_mods WHERE identifier = ?", (identifier,))
+
+    def __serialize(self, entry):
+        if self.purge_descriptions and entry.description is not None:
+            entry = copy.copy(entry)
+            entry.__setattr__(f"_{type(entry).__name__}__description", None)
+
+        return pickle.dumps(entry)
+
+    @property
+    def path(self):
+        return self.__path
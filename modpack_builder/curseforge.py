@@ -1,7 +1,11 @@
-import itertools
+import re
+import json
+import asyncio
 import dataclasses
 
+from abc import ABC, abstractmethod
 from enum import Enum
+from json.decoder import scanstring
 
 import arrow
 import requests
@@ -13,6 +17,116 @@ from orderedset import OrderedSet
 CURSEFORGE_API_BASE_URL = "https://api.cfwidget.com/minecraft/mc-mods/{}"
 CURSEFORGE_DOWNLOAD_BASE_URL = "https://edge.forgecdn.net/files/{}/{}/{}"
 CURSEFORGE_MOD_BASE_URL = "https://www.curseforge.com/minecraft/mc-mods/{}"
+# Every file is served by each of these hosts, the first is the one used when there is no choice of mirror
+CURSEFORGE_DOWNLOAD_MIRRORS = [
+    CURSEFORGE_DOWNLOAD_BASE_URL,
+    "https://media.forgecdn.net/files/{}/{}/{}"
+]
+
+# Keys of a project response that are not decoded unless asked for. The description is an HTML document that is
+# usually the bulk of the response, and the versions repeat every file again under each version that it lists.
+CURSEFORGE_SKIPPED_KEYS = frozenset(("description", "versions"))
+
+_JSON_DECODER = json.JSONDecoder()
+# Every object inside of a skipped value is thrown away as soon as it has been scanned, instead of being
+# kept until the whole value is done, so skipping is still done by the C scanner but holds on to nothing.
+_JSON_DISCARDING_DECODER = json.JSONDecoder(object_pairs_hook=lambda pairs: None)
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Characters of a skipped string that are decoded at once, the rest of it is never held in memory
+_JSON_SKIP_CHUNK_SIZE = 256 * 1024
+
+
+def _parse_object(text, skip_keys=CURSEFORGE_SKIPPED_KEYS):
+    """
+    Decode a JSON object, only scanning past the values of the skipped keys instead of keeping them.
+    """
+    if not skip_keys:
+        return json.loads(text)
+
+    index = _JSON_WHITESPACE.match(text).end()
+
+    if text[index:index + 1] != "{":
+        return json.loads(text)
+
+    result = dict()
+    index = _JSON_WHITESPACE.match(text, index + 1).end()
+
+    if text[index:index + 1] == "}":
+        return result
+
+    while True:
+        if text[index:index + 1] != '"':
+            raise json.JSONDecodeError("Expecting property name enclosed in double quotes", text, index)
+
+        key, index = scanstring(text, index + 1)
+        index = _JSON_WHITESPACE.match(text, index).end()
+
+        if text[index:index + 1] != ":":
+            raise json.JSONDecodeError("Expecting ':' delimiter", text, index)
+
+        index = _JSON_WHITESPACE.match(text, index + 1).end()
+
+        if key in skip_keys:
+            index = _skip_value(text, index)
+        else:
+            result[key], index = _JSON_DECODER.raw_decode(text, index)
+
+        index = _JSON_WHITESPACE.match(text, index).end()
+
+        if (delimiter := text[index:index + 1]) == "}":
+            return result
+
+        if delimiter != ",":
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, index)
+
+        index = _JSON_WHITESPACE.match(text, index + 1).end()
+
+
+def _skip_value(text, index):
+    if text[index:index + 1] == '"':
+        return _skip_string(text, index)
+
+    return _JSON_DISCARDING_DECODER.raw_decode(text, index)[1]
+
+
+def _skip_string(text, index):
+    # Decoding the whole string only to throw it away would copy all of it, so it is decoded a chunk at a time
+    # until the chunk with the closing quote. A chunk must not end inside of an escape, so one that ends in a
+    # run of backslashes is cut before it, and one that ends in a partial unicode escape or surrogate pair is cut
+    # before that escape once the decoder has pointed it out.
+    start = index
+    index += 1
+
+    while True:
+        end = min(index + _JSON_SKIP_CHUNK_SIZE, len(text))
+
+        while True:
+            while index < end < len(text) and text[end - 1] == "\\":
+                end -= 1
+
+            # Whatever is left is decoded in one go when a chunk can't be cut any shorter
+            if end <= index:
+                end = len(text)
+
+            try:
+                return index + scanstring(text[index:end], 0)[1]
+            except json.JSONDecodeError as error:
+                if end >= len(text):
+                    if error.msg.startswith("Unterminated string"):
+                        raise json.JSONDecodeError("Unterminated string starting at", text, start) from None
+
+                    raise json.JSONDecodeError(error.msg, text, index + error.pos) from None
+
+                if error.msg.startswith("Unterminated string"):
+                    break
+
+                if not error.msg.startswith("Invalid \\uXXXX escape"):
+                    raise json.JSONDecodeError(error.msg, text, index + error.pos) from None
+
+                # The position is just after the backslash that the escape starts with
+                end = index + error.pos - 1
+
+        index = end
 
 
 class ReleaseType(Enum):
@@ -57,6 +171,47 @@ class CurseForgeMod:
         def download(self):
             return CURSEFORGE_DOWNLOAD_BASE_URL.format((id_ := str(self.id))[:4], id_[4:7], self.name)
 
+        def download_urls(self, mirrors=None):
+            id_ = str(self.id)
+
+            return tuple(
+                mirror.format(id_[:4], id_[4:7], self.name) for mirror in mirrors or CURSEFORGE_DOWNLOAD_MIRRORS
+            )
+
+    class FileRecord:
+        # The unparsed form of a file from the API response, only turned into a `FileEntry` once it is needed.
+        # Projects can have thousands of files, and most of them are never looked at.
+        __slots__ = ("id", "url", "display", "name", "type", "version", "filesize", "versions", "downloads",
+                     "uploaded_at")
+
+        def __init__(self, data):
+            for name in CurseForgeMod.FileRecord.__slots__:
+                setattr(self, name, data.get(name))
+
+            self.versions = tuple(self.versions or tuple())
+
+        def entry(self):
+            return CurseForgeMod.FileEntry(
+                id=self.id,
+                url=self.url,
+                display=self.display,
+                name=self.name,
+                type=ReleaseType(self.type) if self.type else None,
+                version=self.version,
+                filesize=self.filesize,
+                versions=frozenset(self.versions),
+                downloads=self.downloads,
+                uploaded_at=arrow.get(self.uploaded_at) if self.uploaded_at else None
+            )
+
+        @staticmethod
+        def from_entry(entry):
+            record = CurseForgeMod.FileRecord(dataclasses.asdict(entry))
+            record.type = entry.type.value if entry.type else None
+            record.uploaded_at = entry.uploaded_at.isoformat() if entry.uploaded_at else None
+
+            return record
+
     def __init__(self, identifier, **kwargs):
         self.__identifier = identifier
 
@@ -85,74 +240,196 @@ class CurseForgeMod:
         self.__members = OrderedSet(CurseForgeMod.MemberEntry(**member) for member in kwargs.get("members", tuple()))
         self.__links = set(kwargs.get("links"))
 
-        self.__files = set()
+        self.__file_records = dict()
 
         for file in kwargs.get("files", tuple()):
-            file["type"] = ReleaseType(file["type"]) if file.get("type") else None
-            file["versions"] = frozenset(file.get("versions", tuple()))
-            file["uploaded_at"] = arrow.get(file["uploaded_at"]) if file.get("uploaded_at") else None
-
-            self.__files.add(CurseForgeMod.FileEntry(**file))
+            self.__file_records[file.get("id")] = CurseForgeMod.FileRecord(file)
 
-        self.__versions = dict()
+        # Only the file IDs are kept for each version, the entries are looked up when the property is first used
+        self.__version_file_ids = dict()
 
-        if type(versions := kwargs.get("versions", dict())) is not list:
-            files_ = dict((file.id, file) for file in self.__files)
+        if (versions := kwargs.get("versions")) is None:
+            # The versions were skipped when the response was parsed, but each file lists the versions it is for
+            for record in self.__file_records.values():
+                for version in record.versions:
+                    self.__version_file_ids.setdefault(version, list()).append(record.id)
 
+            self.__version_file_ids = {version: tuple(ids) for version, ids in self.__version_file_ids.items()}
+        elif type(versions) is not list:
             for version, files in versions.items():
-                self.__versions[version] = set()
-
-                for file in files:
-                    self.__versions[version].add(files_[file["id"]])
+                self.__version_file_ids[version] = tuple(file["id"] for file in files)
 
         self.__description = kwargs.get("description")
         self.__last_fetch = arrow.get(kwargs["last_fetch"]) if kwargs.get("last_fetch") else None
         self.__download = kwargs.get("download")
 
+        # These are not part of the API response, they are the validators taken from the response headers
+        # and the time of the last successful request, used to decide if a cached instance should be revalidated.
+        self.__etag = kwargs.get("etag")
+        self.__last_modified = kwargs.get("last_modified")
+        self.__retrieved_at = arrow.get(kwargs["retrieved_at"]) if kwargs.get("retrieved_at") else None
+
+        self.__reset_file_index()
+
+    def __reset_file_index(self):
+        self.__file_entries = dict()
+        self.__files = None
+        self.__versions = None
+        self.__records_by_version = None
+        self.__files_by_version = dict()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+
+        # Everything derived from the records is cheap to build again, and would bloat every cached entry
+        for name in ("file_entries", "files", "versions", "records_by_version", "files_by_version"):
+            del state[f"_CurseForgeMod__{name}"]
+
+        return state
+
+    def __setstate__(self, state):
+        # Instances pickled before the validators were added will be missing them
+        for name in ("etag", "last_modified", "retrieved_at"):
+            state.setdefault(f"_CurseForgeMod__{name}", None)
+
+        # Instances pickled before the records were introduced hold fully parsed entries instead
+        if "_CurseForgeMod__file_records" not in state:
+            files = state.get("_CurseForgeMod__files") or set()
+            versions = state.get("_CurseForgeMod__versions") or dict()
+
+            state["_CurseForgeMod__file_records"] = {
+                file.id: CurseForgeMod.FileRecord.from_entry(file) for file in files
+            }
+            state["_CurseForgeMod__version_file_ids"] = {
+                version: tuple(file.id for file in files_) for version, files_ in versions.items()
+            }
+
+        for name in ("files", "versions", "files_by_id", "files_by_version"):
+            state.pop(f"_CurseForgeMod__{name}", None)
+
+        self.__dict__.update(state)
+        self.__reset_file_index()
+
+    def is_stale(self, ttl):
+        return self.__retrieved_at is None or arrow.utcnow() >= self.__retrieved_at.shift(seconds=ttl)
+
+    def __file_entry(self, record):
+        if (entry := self.__file_entries.get(record.id)) is None:
+            entry = self.__file_entries[record.id] = record.entry()
+
+        return entry
+
+    def __version_files(self, version, release_type):
+        # Only the files for a version and release type that has been asked for are ever parsed,
+        # and each group is sorted newest-first once, the first time it is needed.
+        if (files := self.__files_by_version.get((version, release_type))) is not None:
+            return files
+
+        if self.__records_by_version is None:
+            self.__records_by_version = dict()
+
+            for record in self.__file_records.values():
+                for version_ in record.versions:
+                    self.__records_by_version.setdefault(version_, list()).append(record)
+
+        files = self.__files_by_version[(version, release_type)] = sorted(
+            (
+                self.__file_entry(record)
+                for record in self.__records_by_version.get(version, tuple())
+                if record.type == release_type.value
+            ),
+            key=lambda file_: file_.uploaded_at,
+            reverse=True
+        )
+
+        return files
+
     def latest_files(self, game_versions):
         results = {member: None for member in ReleaseType}
-        files = sorted(self.files, key=lambda file_: file_.uploaded_at, reverse=True)
 
-        for file, version in itertools.product(files, game_versions):
-            if version in file.versions and results[file.type] is None:
-                results[file.type] = file
+        for release_type in ReleaseType:
+            for version in game_versions:
+                if not (files := self.__version_files(version, release_type)):
+                    continue
 
-                if all(results.values()):
-                    break
+                if results[release_type] is None or files[0].uploaded_at > results[release_type].uploaded_at:
+                    results[release_type] = files[0]
 
         return results
 
     def best_file(self, game_versions, release_type):
-        files = list(filter(None, self.latest_files(game_versions).values()))
+        files = tuple(filter(None, self.latest_files(game_versions).values()))
 
         if not files:
             return None
 
-        files.sort(key=lambda file: ReleaseType.values.index(file.type.value))
-        files.sort(key=lambda file: file.uploaded_at, reverse=True)
-        files.sort(
-            key=lambda file: ReleaseType.values.index(file.type.value) > ReleaseType.values.index(release_type.value)
-        )
+        preference = ReleaseType.values.index(release_type.value)
 
-        return files[0]
+        # Prefer files at least as stable as the preference, then the newest, then the most stable
+        return min(files, key=lambda file: (
+            ReleaseType.values.index(file.type.value) > preference,
+            -file.uploaded_at.timestamp(),
+            ReleaseType.values.index(file.type.value)
+        ))
 
     def file(self, id_):
-        for entry in self.files:
-            if entry.id == id_:
-                return entry
+        if (record := self.__file_records.get(id_)) is None:
+            return None
 
-        return None
+        return self.__file_entry(record)
 
     @staticmethod
-    def get(identifier):
-        response = requests.get(CURSEFORGE_API_BASE_URL.format(identifier))
+    def get(identifier, session=None, cached=None, description=False):
+        url = CURSEFORGE_API_BASE_URL.format(identifier)
+        response = (session or requests).get(url, headers=cached.validators if cached else None)
+
+        # Any session will do, but only a `ConnectionPool` keeps statistics of the bytes received from each host
+        if (record := getattr(session, "record", None)) is not None:
+            record(url, len(response.content))
+
+        if cached and response.status_code == 304:
+            cached.__retrieved_at = arrow.utcnow()
+            return cached
 
         if response.status_code != 200 and response.headers.get("content-type") != "application/json":
             response.raise_for_status()
-        elif "error" in (response_json := response.json()):
+        elif "error" in (response_json := CurseForgeMod.__parse_response(response.content, description)):
             raise Exception(response_json["message"])
 
-        return CurseForgeMod(identifier, **response_json)
+        return CurseForgeMod(identifier, **response_json, **CurseForgeMod.__response_validators(response.headers))
+
+    @staticmethod
+    async def get_async(identifier, session, cached=None, description=False):
+        async with session.get(
+            CURSEFORGE_API_BASE_URL.format(identifier),
+            headers=cached.validators if cached else None
+        ) as response:
+            if cached and response.status == 304:
+                cached.__retrieved_at = arrow.utcnow()
+                return cached
+
+            if response.status != 200 and response.headers.get("content-type") != "application/json":
+                response.raise_for_status()
+            elif "error" in (response_json := CurseForgeMod.__parse_response(await response.read(), description)):
+                raise Exception(response_json["message"])
+
+        return CurseForgeMod(identifier, **response_json, **CurseForgeMod.__response_validators(response.headers))
+
+    @staticmethod
+    def __parse_response(content, description=False):
+        # Only the description can be asked for, the versions are always found again from the files
+        skip_keys = CURSEFORGE_SKIPPED_KEYS - {"description"} if description else CURSEFORGE_SKIPPED_KEYS
+
+        # JSON is always UTF-8, and guessing the encoding of a large response can take longer than parsing it
+        return _parse_object(content.decode("utf-8"), skip_keys)
+
+    @staticmethod
+    def __response_validators(headers):
+        return {
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "retrieved_at": arrow.utcnow()
+        }
 
     @property
     def identifier(self):
@@ -216,10 +493,19 @@ class CurseForgeMod:
 
     @property
     def files(self):
+        if self.__files is None:
+            self.__files = set(self.__file_entry(record) for record in self.__file_records.values())
+
         return self.__files
 
     @property
     def versions(self):
+        if self.__versions is None:
+            self.__versions = {
+                version: set(self.file(id_) for id_ in ids if id_ in self.__file_records)
+                for version, ids in self.__version_file_ids.items()
+            }
+
         return self.__versions
 
     @property
@@ -233,3 +519,86 @@ class CurseForgeMod:
     @property
     def download(self):
         return self.__download
+
+    @property
+    def etag(self):
+        return self.__etag
+
+    @property
+    def last_modified(self):
+        return self.__last_modified
+
+    @property
+    def retrieved_at(self):
+        return self.__retrieved_at
+
+    @property
+    def validators(self):
+        headers = dict()
+
+        if self.__etag:
+            headers["If-None-Match"] = self.__etag
+
+        # The time that the widget API last fetched the project from CurseForge is the best that can be done
+        # when the server did not send a 'Last-Modified' header of its own.
+        if self.__last_modified:
+            headers["If-Modified-Since"] = self.__last_modified
+        elif self.__last_fetch:
+            headers["If-Modified-Since"] = self.__last_fetch.to("utc").format("ddd, DD MMM YYYY HH:mm:ss") + " GMT"
+
+        return headers
+
+
+class CurseForgeBackend(ABC):
+    """
+    Retrieves the information of CurseForge projects for the builder. A backend for an API that can answer
+    for many projects in a single request sets the batch size to the most it allows, and overrides `get_many`
+    and `get_many_async` to make that one request.
+    """
+    batch_size = 1
+
+    @abstractmethod
+    def get(self, identifier, session=None, cached=None):
+        pass
+
+    @abstractmethod
+    async def get_async(self, identifier, session, cached=None):
+        pass
+
+    def get_many(self, identifiers, session=None, cache=None):
+        """
+        Return a dictionary of each identifier to its `CurseForgeMod`, or to the exception raised for it.
+        """
+        results = dict()
+
+        for identifier in identifiers:
+            cached = cache.get(identifier) if cache is not None else None
+
+            try:
+                results[identifier] = self.get(identifier, session=session, cached=cached)
+            except Exception as error:
+                results[identifier] = error
+
+        return results
+
+    async def get_many_async(self, identifiers, session, cache=None):
+        """
+        The same as `get_many` with an 'aiohttp' session, the identifiers are requested concurrently.
+        """
+        results = await asyncio.gather(*(
+            self.get_async(identifier, session, cached=cache.get(identifier) if cache is not None else None)
+            for identifier in identifiers
+        ), return_exceptions=True)
+
+        return dict(zip(identifiers, results))
+
+
+class CurseForgeWidgetBackend(CurseForgeBackend):
+    # The widget API only ever answers for a single project, so every identifier is a request of its own
+    batch_size = 1
+
+    def get(self, identifier, session=None, cached=None):
+        return CurseForgeMod.get(identifier, session=session, cached=cached)
+
+    async def get_async(self, identifier, session, cached=None):
+        return await CurseForgeMod.get_async(identifier, session, cached=cached)
@@ -18,6 +18,7 @@ from qtpy.QtWidgets import QMainWindow, QHeaderView, QLineEdit, QTableView, QLab
 import modpack_builder.utilities as utilities
 import modpack_builder.gui.helpers as helpers
 
+from modpack_builder.logs import LogSink
 from modpack_builder.builder import ModpackBuilder
 from modpack_builder.curseforge import ReleaseType
 from modpack_builder.gui.settings import ModpackBuilderSettings
@@ -65,10 +66,6 @@ class ModpackBuilderWindow(QMainWindow):
         )
         self.__load_curseforge_cache_thread.start()
 
-        self.__dump_curseforge_cache_thread = helpers.create_thread(
-            self.settings.dump_curseforge_cache, parent=self
-        )
-
         self.release_type_combo_box.addItems(value.title() for value in ReleaseType.values)
 
         self.__create_information_view()
@@ -159,12 +156,12 @@ class ModpackBuilderWindow(QMainWindow):
         self.concurrent_downloads_spin_box.setValue(self.settings.concurrent_downloads)
 
     def __load_package(self, path):
-        progress_dialog = MultiProgressDialog(self, log_limit=None)
+        progress_dialog = MultiProgressDialog(self)
 
         progress_dialog.setWindowTitle("Loading Modpack Package")
 
         self.builder.reporter = progress_dialog.main_reporter
-        self.builder.logger = progress_dialog.log
+        self.builder.logger = LogSink(progress_dialog.log_records)
 
         @Slot()
         @helpers.connect_slot(progress_dialog.completed)
@@ -184,30 +181,23 @@ class ModpackBuilderWindow(QMainWindow):
 
         @helpers.thread(parent=self, dispose=True)
         def __builder_load_package_thread():
-            self.builder.load_package(path)
+            if not self.builder.load_package(path):
+                progress_dialog.completed.emit()
+                return
 
             # The loading thread should be completed by now, and if it isn't it probably doesn't have much longer
             self.__load_curseforge_cache_thread.wait()
 
-            self.builder.fetch_curseforge_mods(skip_identifiers=self.settings.curseforge_cache.keys())
+            # Fresh entries in the cache are used as they are, and stale ones are revalidated
+            self.builder.fetch_curseforge_mods(cache=self.settings.curseforge_cache)
 
             if not progress_dialog.cancel_requested:
                 # Set the progress bar to indeterminate
                 progress_dialog.main_reporter.maximum = 0
                 progress_dialog.main_reporter.value = 0
 
-                # Load the remaining mods that were skipped (previously cached) into the builder
-                for identifier in self.builder.manifest.curseforge_mods:
-                    if data := self.settings.curseforge_cache.get(identifier):
-                        self.builder.curseforge_mods[identifier] = data
-
-                # Add all of the new mods that were fetched to the cache
-                for identifier in set(self.builder.curseforge_mods.keys()) - set(self.settings.curseforge_cache.keys()):
-                    self.settings.curseforge_cache[identifier] = self.builder.curseforge_mods[identifier]
-
-                # Start a thread in the background so that there is no delay, unless we have to wait for a previous dump
-                self.__dump_curseforge_cache_thread.wait()
-                self.__dump_curseforge_cache_thread.start()
+                # Add all of the new or revalidated mods to the cache, written as a single transaction
+                self.settings.curseforge_cache.update(self.builder.curseforge_mods)
 
                 self.builder.find_curseforge_files()
 
@@ -1,7 +1,8 @@
+import threading
+
 from orderedset import OrderedSet
 
-from qtpy.QtGui import QStandardItemModel
-from qtpy.QtCore import Qt, QAbstractTableModel, QModelIndex, Signal, QTimer, Slot
+from qtpy.QtCore import Qt, QAbstractListModel, QAbstractTableModel, QModelIndex, Signal, QTimer, Slot
 
 import modpack_builder.utilities as utilities
 import modpack_builder.gui.helpers as helpers
@@ -9,16 +10,32 @@ import modpack_builder.gui.helpers as helpers
 from modpack_builder.curseforge import ReleaseType
 
 
-class BufferedItemModel(QStandardItemModel):
+class BufferedItemModel(QAbstractListModel):
+    """
+    List model of plain strings, kept in a ring buffer that holds at most `limit` rows.
+    Rows may be appended from any thread, and are added to the model in batches every `refresh` milliseconds.
+    """
     __row_appended = Signal()
 
-    def __init__(self, parent=None, limit=None, refresh=20):
+    def __init__(self, parent=None, limit=10000, refresh=20):
         super().__init__(parent)
 
-        self.limit = limit
-        self.buffer = list()
+        # The rows are kept in a ring buffer of exactly this size, so there is no such thing as an unlimited model
+        if not isinstance(limit, int) or limit < 1:
+            raise ValueError(f"The limit of a buffered item model must be a positive number of rows, not {limit!r}")
+
+        self.__limit = limit
         self.timer = QTimer()
 
+        # Rows waiting for the next timeout, this is the only state shared with other threads
+        self.__buffer = list()
+        self.__buffer_lock = threading.Lock()
+
+        # The ring itself, row zero is at the start index and the oldest rows are overwritten first
+        self.__rows = [None] * limit
+        self.__start = 0
+        self.__count = 0
+
         self.timer.setSingleShot(True)
         self.timer.setInterval(refresh)
 
@@ -34,28 +51,56 @@ class BufferedItemModel(QStandardItemModel):
             self.__dump_buffer()
 
     def __dump_buffer(self):
-        self.insertRows(self.rowCount(), len(self.buffer))  # Append rows for each item in the buffer
+        with self.__buffer_lock:
+            buffer = self.__buffer
+            self.__buffer = list()
 
-        # Set the items for each new row
-        for offset, item in enumerate(self.buffer):
-            self.setItem(self.rowCount() - len(self.buffer) + offset, 0, item)
+        # Rows that would be evicted by the same batch that added them are never shown at all
+        buffer = buffer[-self.limit:]
 
-        self.buffer.clear()  # Reset the buffer
+        if not buffer:
+            return
 
-    def __apply_limit(self):
-        if self.rowCount() > self.limit:
-            # Remove rows from the beginning, count being the number of rows over the limit
-            self.removeRows(0, self.rowCount() - self.limit)
+        # Evicting from the front only moves the start index, no matter how many rows there are
+        if (overflow := self.__count + len(buffer) - self.limit) > 0:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            self.__start = (self.__start + overflow) % self.limit
+            self.__count -= overflow
+            self.endRemoveRows()
 
-    def insertRows(self, row, count, _=None):
-        super().insertRows(row, count)
+        self.beginInsertRows(QModelIndex(), self.__count, self.__count + len(buffer) - 1)
 
-        if self.limit:
-            self.__apply_limit()
+        for text in buffer:
+            self.__rows[(self.__start + self.__count) % self.limit] = text
+            self.__count += 1
+
+        self.endInsertRows()
+
+    @property
+    def limit(self):
+        return self.__limit
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.__count
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid() or not 0 <= index.row() < self.__count:
+            return None
+
+        return self.__rows[(self.__start + index.row()) % self.limit]
+
+    def appendRow(self, text):
+        # Append the text to the buffer to be added to the model on the next timeout
+        with self.__buffer_lock:
+            self.__buffer.append(text)
+
+        self.__row_appended.emit()
+
+    def appendRows(self, texts):
+        # Any number of rows only costs a single signal
+        with self.__buffer_lock:
+            self.__buffer.extend(texts)
 
-    def appendRow(self, item):
-        # Append the QStandardItem to the internal list to be popped into the model on the next timeout
-        self.buffer.append(item)
         self.__row_appended.emit()
 
 
@@ -248,7 +293,11 @@ class CurseForgeModsTableModel(QAbstractTableModel):
             return self.identifiers[index.row()]
 
         elif index.column() == 1:  # Name
-            return self.builder.curseforge_mods[self.identifiers[index.row()]].title
+            # A mod with a locked file is listed even when its information could not be retrieved
+            if (curseforge_mod := self.builder.curseforge_mods.get(self.identifiers[index.row()])) is None:
+                return None
+
+            return curseforge_mod.title
 
         elif index.column() == 2:  # Version
             curseforge_mod = self.builder.manifest.curseforge_mods[self.identifiers[index.row()]]
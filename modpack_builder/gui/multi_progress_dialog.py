@@ -3,8 +3,7 @@ import os
 from pathlib import Path
 
 from qtpy import uic
-from qtpy.QtGui import QStandardItem
-from qtpy.QtCore import Qt, QObject, Signal, QEvent, QMimeData, Slot
+from qtpy.QtCore import Qt, QObject, Signal, QEvent, QMimeData, Slot, QTimer
 from qtpy.QtWidgets import QDialog, QMessageBox, QProgressBar, QListView, QApplication
 
 import modpack_builder.gui.helpers as helpers
@@ -43,14 +42,10 @@ class ProgressBarReporter(ProgressReporter, QObject):
         self.__progress_bar.setValue(self._value)
         self.__progress_bar.setFormat(self._text)
 
-    @ProgressReporter.maximum.setter
-    def maximum(self, value):
-        ProgressReporter.maximum.fset(self, value)
+    def _report_maximum(self, value):
         self.__set_maximum.emit(int(value))
 
-    @ProgressReporter.value.setter
-    def value(self, value):
-        ProgressReporter.value.fset(self, value)
+    def _report_value(self, value):
         self.__set_value.emit(int(value))
 
     @property
@@ -70,7 +65,7 @@ class MultiProgressDialog(QDialog):
     cancel_confirmation_text = "Are you sure you want to cancel the current task?"
     cancel_confirmation_title = "Cancel Confirmation"
 
-    def __init__(self, parent=None, log_limit=1000, log_refresh=20, *args, **kwargs):
+    def __init__(self, parent=None, log_limit=10000, log_refresh=20, reporter_refresh=50, *args, **kwargs):
         super().__init__(parent, *args, **kwargs)
 
         self.__allow_close = False
@@ -83,10 +78,18 @@ class MultiProgressDialog(QDialog):
         self.progress_bar_container_widget.setVisible(False)
         self.progress_bar_divider_line.setVisible(False)
 
-        self.__main_reporter = ProgressBarReporter()
+        # Progress bars are updated at most once per refresh interval (in milliseconds),
+        # no matter how often the reporters are given new values from the worker threads.
+        self.__reporter_interval = reporter_refresh / 1000 if reporter_refresh else None
+
+        self.__main_reporter = ProgressBarReporter(interval=self.__reporter_interval)
         self.__main_reporter.progress_bar = self.main_progress_bar
         self.__reporter_map = dict()
 
+        # Values held back by the reporters would otherwise only be shown once the next value is set
+        self.__reporter_timer = QTimer(self)
+        self.__reporter_timer.setInterval(reporter_refresh or 0)
+
         self.progress_log_item_model = BufferedItemModel(limit=log_limit, refresh=log_refresh)
         self.progress_log_list_view.setModel(self.progress_log_item_model)
 
@@ -96,6 +99,7 @@ class MultiProgressDialog(QDialog):
         self.__bind_cancel_request_and_completed()
         self.__bind_auto_scroll_handlers()
         self.__bind_reporter_created()
+        self.__bind_reporter_timer()
 
     def show(self):
         # Fix for PySide2 not putting the dialog in the middle of the parent like it should
@@ -138,6 +142,7 @@ class MultiProgressDialog(QDialog):
         @helpers.connect_slot(self.completed)
         def __on_completed():
             self.__allow_close = True
+            self.__reporter_timer.stop()
             self.cancel_button.setText("Close")
             self.cancel_button.setEnabled(True)
 
@@ -187,6 +192,19 @@ class MultiProgressDialog(QDialog):
             current_geometry.moveCenter(initial_geometry.center())
             self.setGeometry(current_geometry)
 
+    def __bind_reporter_timer(self):
+        @Slot()
+        @helpers.connect_slot(self.__reporter_timer.timeout)
+        def __on_reporter_timer_timeout():
+            self.__main_reporter.flush()
+
+            # Reporters are added from the worker threads, so the map may change while it is being flushed
+            for reporter in list(self.__reporter_map):
+                reporter.flush()
+
+        if self.__reporter_interval is not None:
+            self.__reporter_timer.start()
+
     def keyPressEvent(self, event):
         if event.key() != Qt.Key_Escape:
             super().keyPressEvent(event)
@@ -210,10 +228,15 @@ class MultiProgressDialog(QDialog):
                 self.cancel_request.emit()
 
     def log(self, text):
-        self.progress_log_item_model.appendRow(QStandardItem(text))
+        self.progress_log_item_model.appendRow(text)
+
+    def log_records(self, records):
+        self.progress_log_item_model.appendRows([record.message for record in records])
 
     def reporter(self):
-        progress_reporter = ProgressBarReporter(callback=self.__reporter_done_callback)
+        progress_reporter = ProgressBarReporter(
+            callback=self.__reporter_done_callback, interval=self.__reporter_interval
+        )
         self.__reporter_map[progress_reporter] = None
 
         self.reporter_created.emit(progress_reporter)
@@ -2,12 +2,15 @@ import os
 import json
 import pickle
 import shutil
+import sqlite3
 import platform
 
 from pathlib import Path
 from json import JSONDecodeError
 
 from modpack_builder.gui import PROGRAM_NAME
+from modpack_builder.store import FileStore
+from modpack_builder.cache import CurseForgeCache
 
 PLATFORM = platform.system()
 
@@ -24,6 +27,11 @@ class ModpackBuilderSettings:
         self.__settings_directory = None
         self.__settings_file = None
         self.__curseforge_cache_file = None
+        self.__legacy_curseforge_cache_file = None
+        self.__legacy_curseforge_cache_backup_file = None
+
+        self.curseforge_cache = CurseForgeCache()
+        self.file_store_capacity = 4 * 1024 * 1024 * 1024
 
         if path:
             settings_directory = path
@@ -35,8 +43,6 @@ class ModpackBuilderSettings:
 
         self.settings_directory = settings_directory
 
-        self.curseforge_cache = dict()
-
     def load_settings(self):
         if not self.__settings_file.exists() or not self.__settings_file.is_file():
             return False
@@ -47,6 +53,9 @@ class ModpackBuilderSettings:
 
                 self.builder.concurrent_requests = data.get("concurrent_requests", self.builder.concurrent_requests)
                 self.builder.concurrent_downloads = data.get("concurrent_downloads", self.builder.concurrent_downloads)
+                self.builder.adaptive_concurrency = data.get("adaptive_concurrency", self.builder.adaptive_concurrency)
+                self.builder.curseforge_cache_ttl = data.get("curseforge_cache_ttl", self.builder.curseforge_cache_ttl)
+                self.file_store_capacity = data.get("file_store_capacity", self.file_store_capacity)
 
                 if (minecraft_directory := data.get("minecraft_directory")) is not None:
                     self.builder.minecraft_directory = Path(minecraft_directory).resolve()
@@ -64,38 +73,36 @@ class ModpackBuilderSettings:
         return True
 
     def load_curseforge_cache(self):
+        # Opening the database does not read any of the entries, they are each loaded when they are first requested
         try:
-            with open(self.__curseforge_cache_file, "rb") as file:
-                self.curseforge_cache.update(pickle.load(file))
+            self.curseforge_cache.open(self.__curseforge_cache_file)
+        except sqlite3.DatabaseError:
+            self.curseforge_cache.close()
+            self.__curseforge_cache_file.unlink()
+            self.curseforge_cache.open(self.__curseforge_cache_file)
 
-        except (FileNotFoundError, Exception) as exception:
-            if type(exception) is not FileNotFoundError:
-                self.__curseforge_cache_file.unlink()
+        self.__import_legacy_curseforge_cache()
 
-            if self.__curseforge_cache_backup_file.exists() and self.__curseforge_cache_backup_file.is_file():
-                shutil.move(str(self.__curseforge_cache_backup_file), str(self.__curseforge_cache_file))
+        return True
 
-                return self.load_curseforge_cache()
+    def __import_legacy_curseforge_cache(self):
+        # Older versions pickled the entire cache into a single file, which is moved into the database once
+        for path in (self.__legacy_curseforge_cache_file, self.__legacy_curseforge_cache_backup_file):
+            if not path.exists() or not path.is_file():
+                continue
 
-            return False
-
-        return True
+            try:
+                with open(path, "rb") as file:
+                    self.curseforge_cache.update(pickle.load(file))
+            except Exception:
+                continue
+            finally:
+                path.unlink()
 
     def dump_settings(self):
         with open(self.__settings_file, "w") as file:
             json.dump(self.dictionary, file, indent=self.json_indent)
 
-    def dump_curseforge_cache(self, purge=True):
-        if self.__curseforge_cache_file.exists() and self.__curseforge_cache_file.is_file():
-            shutil.move(str(self.__curseforge_cache_file), str(self.__curseforge_cache_backup_file))
-
-        if purge:
-            for entry in self.curseforge_cache.values():
-                entry.__setattr__(f"_{type(entry).__name__}__description", None)
-
-        with open(self.__curseforge_cache_file, "wb") as file:
-            pickle.dump(self.curseforge_cache, file)
-
     @staticmethod
     def get_settings_directory():
         if PLATFORM == "Windows":
@@ -151,8 +158,28 @@ class ModpackBuilderSettings:
             self.__curseforge_cache_file.exists() and
             self.__curseforge_cache_file.is_file()
         ):
+            # The database must be closed before it can be moved, and is opened again from the new location
+            cache_was_open = self.curseforge_cache.path is not None
+            self.curseforge_cache.close()
+
             shutil.move(str(self.__curseforge_cache_file), str(value))
 
+            if cache_was_open:
+                self.curseforge_cache.open(value / self.__curseforge_cache_file.name)
+
+        # The store is moved as a whole, which is only a rename unless the new directory is on another drive
+        if self.builder.file_store:
+            self.builder.file_store.close()
+            self.builder.file_store = None
+
+        for name in ("files", "downloads"):
+            if (
+                self.settings_directory and
+                (directory := self.settings_directory / name).is_dir() and
+                not (value / name).exists()
+            ):
+                shutil.move(str(directory), str(value / name))
+
         if (
             self.settings_directory and
             self.settings_directory.exists() and
@@ -163,8 +190,14 @@ class ModpackBuilderSettings:
 
         self.__settings_directory = value
         self.__settings_file = value / "settings.json"
-        self.__curseforge_cache_file = value / "curseforge_cache.dat"
-        self.__curseforge_cache_backup_file = value / "curseforge_cache.dat.bak"
+        self.__curseforge_cache_file = value / "curseforge_cache.db"
+        self.__legacy_curseforge_cache_file = value / "curseforge_cache.dat"
+        self.__legacy_curseforge_cache_backup_file = value / "curseforge_cache.dat.bak"
+
+        # Keeping downloads in the settings directory lets an interrupted install be resumed after a restart
+        self.builder.downloads_directory = value / "downloads"
+
+        self.builder.file_store = FileStore(value / "files", capacity=self.file_store_capacity)
 
         ModpackBuilderSettings.set_settings_directory(value)
 
@@ -186,6 +219,36 @@ class ModpackBuilderSettings:
         self.builder.concurrent_downloads = value
         self.dump_settings()
 
+    @property
+    def adaptive_concurrency(self):
+        return self.builder.adaptive_concurrency
+
+    @adaptive_concurrency.setter
+    def adaptive_concurrency(self, value):
+        self.builder.adaptive_concurrency = value
+        self.dump_settings()
+
+    @property
+    def curseforge_cache_ttl(self):
+        return self.builder.curseforge_cache_ttl
+
+    @curseforge_cache_ttl.setter
+    def curseforge_cache_ttl(self, value):
+        self.builder.curseforge_cache_ttl = value
+        self.dump_settings()
+
+    @property
+    def file_store_capacity(self):
+        return self.__file_store_capacity
+
+    @file_store_capacity.setter
+    def file_store_capacity(self, value):
+        self.__file_store_capacity = value
+
+        if self.builder.file_store:
+            self.builder.file_store.capacity = value
+            self.builder.file_store.evict()
+
     @property
     def minecraft_directory(self):
         return self.builder.minecraft_directory
@@ -219,6 +282,9 @@ class ModpackBuilderSettings:
 
         dictionary["concurrent_requests"] = self.concurrent_requests
         dictionary["concurrent_downloads"] = self.concurrent_downloads
+        dictionary["adaptive_concurrency"] = self.adaptive_concurrency
+        dictionary["curseforge_cache_ttl"] = self.curseforge_cache_ttl
+        dictionary["file_store_capacity"] = self.file_store_capacity
 
         if self.minecraft_directory:
             dictionary["minecraft_directory"] = str(self.minecraft_directory.resolve())
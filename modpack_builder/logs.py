@@ -0,0 +1,161 @@
+import json
+import time
+import threading
+import dataclasses
+
+from enum import Enum
+
+
+class LogLevel(Enum):
+    debug = 10
+    info = 20
+    warning = 30
+    error = 40
+
+
+@dataclasses.dataclass
+class LogRecord:
+    level: LogLevel
+    message: str
+    phase: str = None
+    identifier: str = None
+    # Seconds since the phase that the record belongs to was started
+    elapsed: float = None
+    created: float = dataclasses.field(default_factory=time.time)
+
+    def __str__(self):
+        return self.message
+
+    def to_json(self):
+        return json.dumps({
+            "level": self.level.name,
+            "message": self.message,
+            "phase": self.phase,
+            "identifier": self.identifier,
+            "elapsed": self.elapsed,
+            "created": self.created
+        })
+
+
+class LogSink:
+    """
+    Collects log records from any number of threads, and delivers them to the callback as lists.
+    """
+    # Records are delivered once this many are waiting, or once the interval (in seconds) has passed
+    batch_size = 256
+    interval = 0.1
+
+    def __init__(self, callback=None, level=LogLevel.debug):
+        self.__lock = threading.RLock()
+        self.__callback = callback
+        self.__records = list()
+        self.__flushed_at = time.monotonic()
+        self.__export_file = None
+        # Armed by the first record that is held back, and delivers it even if nothing else is logged after it
+        self.__timer = None
+        self.__phase = None
+        self.__phase_started_at = time.monotonic()
+
+        # Records below this level are never given to the callback, but are still exported
+        self.level = level
+
+    @staticmethod
+    def wrap(logger):
+        """
+        Create a sink that gives the message of every record to a function that takes a single string, such as `print`.
+        """
+        def __callback(records):
+            for record in records:
+                logger(record.message)
+
+        return LogSink(__callback)
+
+    @property
+    def phase(self):
+        return self.__phase
+
+    @phase.setter
+    def phase(self, value):
+        with self.__lock:
+            # Whatever is left of the previous phase is delivered before any record of the next one
+            self.flush()
+
+            self.__phase = value
+            self.__phase_started_at = time.monotonic()
+
+    def log(self, message, level=LogLevel.info, identifier=None):
+        with self.__lock:
+            record = LogRecord(
+                level=level,
+                message=message,
+                phase=self.__phase,
+                identifier=identifier,
+                elapsed=time.monotonic() - self.__phase_started_at
+            )
+
+            if self.__export_file:
+                self.__export_file.write(record.to_json() + "\n")
+
+            if level.value < self.level.value:
+                return
+
+            self.__records.append(record)
+
+            if len(self.__records) < self.batch_size and time.monotonic() - self.__flushed_at < self.interval:
+                if self.__timer is None:
+                    self.__timer = threading.Timer(self.interval, self.flush)
+                    self.__timer.daemon = True
+                    self.__timer.start()
+
+                return
+
+        self.flush()
+
+    def __call__(self, message, level=LogLevel.info, identifier=None):
+        self.log(message, level=level, identifier=identifier)
+
+    def debug(self, message, identifier=None):
+        self.log(message, level=LogLevel.debug, identifier=identifier)
+
+    def info(self, message, identifier=None):
+        self.log(message, level=LogLevel.info, identifier=identifier)
+
+    def warning(self, message, identifier=None):
+        self.log(message, level=LogLevel.warning, identifier=identifier)
+
+    def error(self, message, identifier=None):
+        self.log(message, level=LogLevel.error, identifier=identifier)
+
+    def flush(self):
+        with self.__lock:
+            records = self.__records
+            self.__records = list()
+            self.__flushed_at = time.monotonic()
+
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+
+            if self.__export_file:
+                self.__export_file.flush()
+
+            # The callback is called while holding the lock so that batches are always delivered in order
+            if records and self.__callback:
+                self.__callback(records)
+
+    def export(self, path):
+        """
+        Write every record from now on to the file at the path as JSON lines, regardless of the level.
+        """
+        with self.__lock:
+            self.close()
+            self.__export_file = open(path, "a", encoding="utf-8")
+
+    def close(self):
+        with self.__lock:
+            self.flush()
+
+            if self.__export_file:
+                self.__export_file.close()
+
+            self.__export_file = None
@@ -38,6 +38,15 @@ class ModpackManifest:
         url: str = None
         server: bool = None
 
+    @dataclasses.dataclass(frozen=True)
+    class LockedFile:
+        identifier: str = None
+        id: int = None
+        name: str = None
+        filesize: int = None
+        # Only known once the file has been downloaded by whoever updated the lock
+        sha1: str = None
+
     def __init__(self, data):
         self.profile_name = data.get("profile_name")
         self.profile_id = data.get("profile_id")
@@ -112,6 +121,13 @@ class ModpackManifest:
                 server=True
             )
 
+        # The files that were resolved for the CurseForge mods when the lock was last updated.
+        # Locked mods are installed from these directly, without needing any of the project information.
+        self.lock = dict()
+
+        for identifier, entry in data.get("lock", dict()).items():
+            self.lock[identifier] = ModpackManifest.LockedFile(identifier=identifier, **entry)
+
     @property
     def dictionary(self):
         dictionary = dict()
@@ -158,15 +174,15 @@ class ModpackManifest:
         server_external_mods = dict()
 
         for entry in self.external_mods.values():
-            dictionary = dataclasses.asdict(entry)
+            entry_dictionary = dataclasses.asdict(entry)
 
-            del dictionary["identifier"]
-            del dictionary["server"]
+            del entry_dictionary["identifier"]
+            del entry_dictionary["server"]
 
             if entry.server:
-                server_external_mods[entry.identifier] = dictionary
+                server_external_mods[entry.identifier] = entry_dictionary
             else:
-                client_external_mods[entry.identifier] = dictionary
+                client_external_mods[entry.identifier] = entry_dictionary
 
         client_data["external_mods"] = client_external_mods
         server_data["external_mods"] = server_external_mods
@@ -175,14 +191,13 @@ class ModpackManifest:
         server_curseforge_mods = list()
 
         for entry in self.curseforge_mods.values():
+            # A release type is written by its value, the same as it is read, rather than as the enum member
+            version = entry.version.value if isinstance(entry.version, ReleaseType) else entry.version
+
             if entry.server:
-                server_curseforge_mods.append(
-                    f"{entry.identifier}:{entry.version}" if entry.version else entry.identifier
-                )
+                server_curseforge_mods.append(f"{entry.identifier}:{version}" if version else entry.identifier)
             else:
-                client_curseforge_mods.append(
-                    f"{entry.identifier}:{entry.version}" if entry.version else entry.identifier
-                )
+                client_curseforge_mods.append(f"{entry.identifier}:{version}" if version else entry.identifier)
 
         client_curseforge_mods.sort()
         server_curseforge_mods.sort()
@@ -193,4 +208,15 @@ class ModpackManifest:
         dictionary["client"] = client_data
         dictionary["server"] = server_data
 
+        lock = dict()
+
+        for identifier in sorted(self.lock.keys()):
+            entry_dictionary = dataclasses.asdict(self.lock[identifier])
+
+            del entry_dictionary["identifier"]
+
+            lock[identifier] = entry_dictionary
+
+        dictionary["lock"] = lock
+
         return dictionary
\ No newline at end of file
@@ -0,0 +1,680 @@
+import time
+import random
+import asyncio
+import threading
+import contextlib
+import collections
+import dataclasses
+
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import arrow
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as URLLibHTTPError
+
+
+class ConnectionPool:
+    # Seconds to wait for a connection, and then for each read of the response, unless a request is given its own.
+    # A request or a download that stalls fails with a timeout that can be retried, rather than holding its worker
+    # until the host closes the connection, which it might never do.
+    timeout = (10, 30)
+
+    @dataclasses.dataclass
+    class HostStatistics:
+        host: str = None
+        requests: int = 0
+        connections: int = 0
+        bytes: int = 0
+
+        @property
+        def reused(self):
+            return max(self.requests - self.connections, 0)
+
+    def __init__(self, size=8):
+        self.__lock = threading.Lock()
+        self.__session = requests.Session()
+        self.__size = 0
+        self.__adapter = None
+
+        # Statistics from connection pools that have been discarded by a resize are kept here,
+        # the live pools are read directly from the adapter whenever a report is requested.
+        self.__retired = dict()
+        self.__bytes = dict()
+        # Requests and connections counted by `record_request`, for requests that were sent some other way
+        self.__external = dict()
+
+        # Every request waits for a token from the limiter of its host, when one is given
+        self.rate_limiter = None
+
+        self.resize(size)
+
+    def resize(self, size):
+        with self.__lock:
+            if size <= self.__size:
+                return
+
+            if self.__adapter:
+                self.__retire_adapter(self.__adapter)
+
+            # Each host gets its own pool of connections, which should be large enough to give every worker
+            # a connection of its own so that none of them are closed and opened again after each request.
+            self.__size = size
+            self.__adapter = HTTPAdapter(pool_connections=4, pool_maxsize=size)
+
+            self.__session.mount("http://", self.__adapter)
+            self.__session.mount("https://", self.__adapter)
+
+    def get(self, url, **kwargs):
+        if self.rate_limiter:
+            self.rate_limiter.acquire(url)
+
+        kwargs.setdefault("timeout", self.timeout)
+
+        response = self.__session.get(url, **kwargs)
+
+        # A host that asks for a pause gets one from every worker, not only from the one that was told
+        if self.rate_limiter and (retry_after := parse_retry_after(response.status_code, response.headers)) is not None:
+            self.rate_limiter.defer(url, retry_after)
+
+        return response
+
+    def record(self, url, size):
+        host = urlsplit(url).hostname
+
+        with self.__lock:
+            self.__bytes[host] = self.__bytes.get(host, 0) + size
+
+    def record_request(self, url, new_connection=False):
+        """
+        Count a request to the host that was not sent through this pool, such as one from an 'aiohttp' session,
+        so that the report still covers every request made to it.
+        """
+        host = urlsplit(url).hostname
+
+        with self.__lock:
+            request_count, connection_count = self.__external.get(host, (0, 0))
+            self.__external[host] = (request_count + 1, connection_count + (1 if new_connection else 0))
+
+    def close(self):
+        with self.__lock:
+            if self.__adapter:
+                self.__retire_adapter(self.__adapter)
+
+            self.__session.close()
+
+    def statistics(self):
+        with self.__lock:
+            results = dict()
+
+            for counts in (self.__retired, self.__external):
+                for host, (request_count, connection_count) in counts.items():
+                    entry = results.setdefault(host, ConnectionPool.HostStatistics(host))
+                    entry.requests += request_count
+                    entry.connections += connection_count
+
+            for host, request_count, connection_count in self.__iterate_pools(self.__adapter):
+                entry = results.setdefault(host, ConnectionPool.HostStatistics(host))
+                entry.requests += request_count
+                entry.connections += connection_count
+
+            for host, size in self.__bytes.items():
+                results.setdefault(host, ConnectionPool.HostStatistics(host)).bytes = size
+
+            return results
+
+    def report(self):
+        lines = list()
+
+        for entry in sorted(self.statistics().values(), key=lambda entry_: entry_.host):
+            lines.append(
+                f"{entry.host}: {entry.requests} requests, {entry.connections} new connections, "
+                f"{entry.reused} reused, {entry.bytes} bytes"
+            )
+
+        return lines
+
+    def __retire_adapter(self, adapter):
+        for host, request_count, connection_count in self.__iterate_pools(adapter):
+            previous_requests, previous_connections = self.__retired.get(host, (0, 0))
+            self.__retired[host] = (previous_requests + request_count, previous_connections + connection_count)
+
+        adapter.close()
+
+    @staticmethod
+    def __iterate_pools(adapter):
+        if adapter is None:
+            return
+
+        pools = adapter.poolmanager.pools
+
+        for key in pools.keys():
+            if (pool := pools.get(key)) is None:
+                continue
+
+            yield pool.host, pool.num_requests, pool.num_connections
+
+
+class MirrorSelector:
+    """
+    Keeps track of the latency and failures of every host that serves the same files,
+    so that each request can be sent to the host that is currently the fastest and healthiest.
+    """
+    @dataclasses.dataclass
+    class HostHealth:
+        host: str = None
+        latency: float = None
+        requests: int = 0
+        failures: int = 0
+        consecutive_failures: int = 0
+        avoided_until: float = 0
+        fallbacks_won: int = 0
+
+    # Weight of the newest sample in the moving average of the latency of each host
+    latency_smoothing = 0.3
+    # Seconds that a failing host is avoided for, doubled for every consecutive failure after the first
+    failure_cooldown = 10
+    # A second request is sent to the next mirror once the first has gone this many times its host's latency
+    # without a response, but never sooner than the minimum or later than the default for when no host is measured.
+    hedge_factor = 3
+    hedge_minimum = 0.25
+    hedge_default = 0.5
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__hosts = dict()
+
+    def rank(self, urls):
+        """
+        Order the URLs from the most to the least preferred, by the health and then the latency of their hosts.
+        """
+        current_time = time.monotonic()
+
+        with self.__lock:
+            def __key(url):
+                health = self.__hosts.get(urlsplit(url).netloc)
+
+                if health is None:
+                    # A host that has never been measured is tried early, otherwise it never would be
+                    return 0, 0
+
+                if health.avoided_until > current_time:
+                    return 1, health.avoided_until
+
+                return 0, health.latency or 0
+
+            return sorted(urls, key=__key)
+
+    def hedge_delay(self, url):
+        with self.__lock:
+            if (health := self.__hosts.get(urlsplit(url).netloc)) is not None and health.latency is not None:
+                latency = health.latency
+            elif latencies := [health.latency for health in self.__hosts.values() if health.latency is not None]:
+                # A host that has not been measured yet is expected to respond about as fast as the fastest mirror
+                latency = min(latencies)
+            else:
+                return self.hedge_default
+
+            return min(max(latency * self.hedge_factor, self.hedge_minimum), self.hedge_default)
+
+    def record_success(self, url, latency, fallback=False):
+        with self.__lock:
+            health = self.__health(url)
+            health.requests += 1
+            health.consecutive_failures = 0
+            health.avoided_until = 0
+
+            if health.latency is None:
+                health.latency = latency
+            else:
+                health.latency += (latency - health.latency) * self.latency_smoothing
+
+            if fallback:
+                health.fallbacks_won += 1
+
+    def record_failure(self, url):
+        with self.__lock:
+            health = self.__health(url)
+            health.requests += 1
+            health.failures += 1
+            health.consecutive_failures += 1
+            health.avoided_until = (
+                time.monotonic() + self.failure_cooldown * 2 ** (health.consecutive_failures - 1)
+            )
+
+    def statistics(self):
+        with self.__lock:
+            return {host: dataclasses.replace(health) for host, health in self.__hosts.items()}
+
+    def report(self):
+        lines = list()
+
+        for entry in sorted(self.statistics().values(), key=lambda entry_: entry_.host):
+            latency = f"{entry.latency * 1000:.0f}ms" if entry.latency is not None else "unknown"
+            lines.append(
+                f"{entry.host}: {entry.requests} requests, {entry.failures} failures, "
+                f"{entry.fallbacks_won} served in place of the first choice, {latency} latency"
+            )
+
+        return lines
+
+    def __health(self, url):
+        # The port is part of the key, so that mirrors on the same host are still told apart
+        host = urlsplit(url).netloc
+
+        if (health := self.__hosts.get(host)) is None:
+            health = self.__hosts[host] = MirrorSelector.HostHealth(host)
+
+        return health
+
+
+class ConcurrencyController:
+    """
+    Adjusts how many requests to a pool of hosts are in flight at once, between the minimum and the maximum,
+    by additive increase and multiplicative decrease from the throughput, latency and errors of those that completed.
+    """
+    # The limit is cut by this factor on an error that suggests the host is overloaded, at most once per cooldown,
+    # since the other requests that were in flight at the time are likely to fail as well.
+    decrease_factor = 0.5
+    decrease_cooldown = 1.0
+    # A window whose latency is this many times the lowest seen so far means that requests are queueing,
+    # the latency is per unit of size so that a window of large downloads is not mistaken for a slow one.
+    latency_tolerance = 1.5
+    # The lowest latency rises by this fraction every window, so that a host that has become slower for good
+    # is eventually measured against what it is now, instead of against a single fast window from long ago.
+    baseline_drift = 0.01
+    # A window whose throughput is this fraction lower than the one before an increase means that it did not help
+    throughput_tolerance = 0.1
+    # The limit is only increased after this many good windows in a row, a single window that happened to be fast
+    # would otherwise be followed by an increase and a decrease back as soon as the noise evens out.
+    increase_windows = 3
+    # A window is never smaller than this, a single sample says too little about the latency
+    minimum_window = 4
+
+    def __init__(self, limit, minimum=1, maximum=None):
+        self.__condition = threading.Condition()
+        self.__limit = limit
+        self.__in_flight = 0
+        # Coroutines waiting for a slot, each with the loop it has to be woken on
+        self.__async_waiters = collections.deque()
+
+        self.minimum = min(minimum, limit)
+        self.maximum = max(maximum or limit, limit)
+
+        # Each window is as many completions as the limit, and is compared against the one before it
+        self.__window_count = 0
+        self.__window_size = 0
+        self.__window_latency = 0
+        self.__window_started_at = time.monotonic()
+        self.__window_saturated = False
+        self.__previous_throughput = None
+        self.__good_windows = 0
+        self.__increased = False
+        self.__lowest_latency = None
+        self.__decreased_at = 0
+
+        self.peak = limit
+        self.increases = 0
+        self.decreases = 0
+
+    @property
+    def limit(self):
+        return self.__limit
+
+    @property
+    def adaptive(self):
+        return self.minimum != self.maximum
+
+    @contextlib.contextmanager
+    def slot(self):
+        """
+        Wait until there are fewer requests in flight than the limit, and count this one until it exits.
+        """
+        with self.__condition:
+            while self.__in_flight >= self.__limit:
+                self.__condition.wait()
+
+            self.__enter()
+
+        try:
+            yield
+        finally:
+            self.__exit()
+
+    @contextlib.asynccontextmanager
+    async def slot_async(self):
+        """
+        The same as `slot` for a coroutine, which waits for its turn without blocking the event loop.
+        """
+        loop = asyncio.get_running_loop()
+
+        while True:
+            with self.__condition:
+                if self.__in_flight < self.__limit:
+                    self.__enter()
+                    break
+
+                waiter = loop.create_future()
+                self.__async_waiters.append((loop, waiter))
+
+            await waiter
+
+        try:
+            yield
+        finally:
+            self.__exit()
+
+    def record_success(self, latency, size=1):
+        """
+        Count a completed request, the size is whatever measures its throughput, such as bytes for a download.
+        """
+        with self.__condition:
+            self.__window_count += 1
+            self.__window_size += size
+            self.__window_latency += latency
+
+            if self.__window_count < max(self.__limit, self.minimum_window):
+                return
+
+            elapsed = max(time.monotonic() - self.__window_started_at, 1e-6)
+            throughput = self.__window_size / elapsed
+            average_latency = self.__window_latency / max(self.__window_size, 1)
+
+            if self.__lowest_latency is None:
+                self.__lowest_latency = average_latency
+            else:
+                self.__lowest_latency = min(self.__lowest_latency * (1 + self.baseline_drift), average_latency)
+
+            if average_latency > self.__lowest_latency * self.latency_tolerance:
+                self.__set_limit(self.__limit - 1)
+            elif not self.__window_saturated:
+                self.__set_limit(self.__limit)
+                throughput = None
+            elif (
+                self.__increased and
+                self.__previous_throughput is not None and
+                throughput < self.__previous_throughput * (1 - self.throughput_tolerance)
+            ):
+                # Only the window right after an increase is compared, between any other two it is only noise
+                self.__set_limit(self.__limit - 1)
+            elif (good_windows := self.__good_windows + 1) >= self.increase_windows:
+                self.__set_limit(self.__limit + 1)
+            else:
+                self.__set_limit(self.__limit)
+                self.__good_windows = good_windows
+
+            self.__previous_throughput = throughput
+
+    def record_error(self):
+        """
+        Count a request that failed because the host is overloaded or throttling, such as with a 429 or 503.
+        """
+        with self.__condition:
+            if (current_time := time.monotonic()) - self.__decreased_at < self.decrease_cooldown:
+                return
+
+            self.__decreased_at = current_time
+            self.__set_limit(int(self.__limit * self.decrease_factor))
+
+            # The throughput from before the decrease is no longer anything to compare against
+            self.__previous_throughput = None
+
+    def report(self):
+        return (
+            f"limit of {self.__limit} between {self.minimum} and {self.maximum}, peaked at {self.peak}, "
+            f"{self.increases} increases and {self.decreases} decreases"
+        )
+
+    def __enter(self):
+        self.__in_flight += 1
+
+        # Throughput only says anything about the limit when the limit is what holds the requests back
+        if self.__in_flight >= self.__limit:
+            self.__window_saturated = True
+
+    def __exit(self):
+        with self.__condition:
+            self.__in_flight -= 1
+            self.__condition.notify()
+            self.__wake_async(1)
+
+    def __wake_async(self, count):
+        # A woken coroutine checks for a free slot again just like a thread does, it is not handed one
+        while count > 0 and self.__async_waiters:
+            loop, waiter = self.__async_waiters.popleft()
+            loop.call_soon_threadsafe(self.__resume, waiter)
+            count -= 1
+
+    def __resume(self, waiter):
+        if not waiter.done():
+            waiter.set_result(None)
+            return
+
+        # The coroutine was cancelled while it waited, so its turn goes to the next one
+        with self.__condition:
+            self.__wake_async(1)
+
+    def __set_limit(self, limit):
+        limit = min(max(limit, self.minimum), self.maximum)
+
+        if limit > self.__limit:
+            self.increases += 1
+            self.peak = max(self.peak, limit)
+            self.__condition.notify(limit - self.__limit)
+            self.__wake_async(limit - self.__limit)
+        elif limit < self.__limit:
+            self.decreases += 1
+
+        self.__increased = limit > self.__limit
+        self.__good_windows = 0
+        self.__limit = limit
+        self.__window_count = 0
+        self.__window_size = 0
+        self.__window_latency = 0
+        self.__window_started_at = time.monotonic()
+        self.__window_saturated = self.__in_flight >= limit
+
+
+class RateLimiter:
+    """
+    A token bucket for every host, refilled at the rate (in requests per second) up to the burst.
+    """
+    def __init__(self, rate=None, burst=None):
+        self.__lock = threading.Lock()
+        self.__buckets = dict()
+        self.__limits = dict()
+
+        # The limit of any host without one of its own, there is no limit when the rate is none
+        self.rate = rate
+        self.burst = burst
+
+    def set_limit(self, host, rate, burst=None):
+        with self.__lock:
+            self.__limits[host] = (rate, burst)
+
+    def acquire(self, url):
+        """
+        Block until a request may be sent to the host of the URL.
+        """
+        host = urlsplit(url).netloc
+
+        while (delay := self.__take(host)) > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, url):
+        """
+        The same as `acquire` without blocking the event loop.
+        """
+        host = urlsplit(url).netloc
+
+        while (delay := self.__take(host)) > 0:
+            await asyncio.sleep(delay)
+
+    def defer(self, url, delay):
+        """
+        Hold back every request to the host of the URL for the delay (in seconds), as a 'Retry-After' asks.
+        """
+        host = urlsplit(url).netloc
+
+        with self.__lock:
+            bucket = self.__bucket(host)
+            bucket[2] = max(bucket[2], time.monotonic() + delay)
+
+    def __take(self, host):
+        # Returns zero once a token has been taken, otherwise the time until there should be one
+        with self.__lock:
+            rate, burst = self.__limits.get(host, (self.rate, self.burst))
+            bucket = self.__bucket(host)
+            current_time = time.monotonic()
+
+            if bucket[2] > current_time:
+                return bucket[2] - current_time
+
+            if not rate:
+                return 0
+
+            burst = burst or max(rate, 1)
+            tokens, updated_at, _ = bucket
+            tokens = min(tokens + (current_time - updated_at) * rate, burst)
+
+            if tokens >= 1:
+                bucket[0:2] = [tokens - 1, current_time]
+                return 0
+
+            bucket[0:2] = [tokens, current_time]
+
+            return (1 - tokens) / rate
+
+    def __bucket(self, host):
+        # Each bucket is the number of tokens, when that was counted, and when the host may be asked again
+        if (bucket := self.__buckets.get(host)) is None:
+            rate, burst = self.__limits.get(host, (self.rate, self.burst))
+            bucket = self.__buckets[host] = [burst or max(rate or 0, 1), time.monotonic(), 0]
+
+        return bucket
+
+
+class RetryPolicy:
+    """
+    Decides which errors are worth trying again, and how long to wait before each attempt.
+    """
+    # Statuses that a server uses when it is overloaded or throttling, rather than when the request is wrong
+    retry_statuses = frozenset((408, 425, 429, 500, 502, 503, 504))
+    retry_exceptions = (requests.ConnectionError, requests.Timeout, URLLibHTTPError, asyncio.TimeoutError)
+
+    def __init__(self, attempts=4, base_delay=0.5, maximum_delay=30):
+        # The number of tries in total, including the first
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.maximum_delay = maximum_delay
+
+        # Exceptions other than those above that should be retried, such as a download that was cut short
+        self.extra_exceptions = tuple()
+
+    def is_retryable(self, error):
+        if isinstance(error, requests.HTTPError):
+            return error.response is not None and error.response.status_code in self.retry_statuses
+
+        # The response errors of 'aiohttp' carry the status themselves
+        if isinstance(status := getattr(error, "status", None), int):
+            return status in self.retry_statuses
+
+        return isinstance(error, self.retry_exceptions + self.extra_exceptions)
+
+    def delay(self, attempt, error=None):
+        """
+        Seconds to wait before the attempt after the given one (counted from zero), with "full jitter"
+        so that workers that failed together do not all come back at once, and never shorter than a
+        'Retry-After' that came with the error.
+        """
+        delay = random.uniform(0, min(self.base_delay * 2 ** attempt, self.maximum_delay))
+
+        if (retry_after := error_retry_after(error)) is not None:
+            delay = max(delay, min(retry_after, self.maximum_delay))
+
+        return delay
+
+    def call(self, function, *args, aborted=None, on_retry=None, **kwargs):
+        """
+        Call the function until it returns, raises an error that is not retryable, or runs out of attempts.
+        The callback is given the attempt that failed, the error, and the delay before the next attempt.
+        """
+        for attempt in range(self.attempts):
+            try:
+                return function(*args, **kwargs)
+            except Exception as error:
+                if attempt + 1 >= self.attempts or not self.is_retryable(error) or (aborted and aborted()):
+                    raise
+
+                delay = self.delay(attempt, error)
+
+                if on_retry:
+                    on_retry(attempt, error, delay)
+
+                if not self.sleep(delay, aborted):
+                    raise
+
+    async def call_async(self, function, *args, on_retry=None, **kwargs):
+        """
+        The same as `call` for a coroutine function, the task is aborted by cancelling it.
+        """
+        for attempt in range(self.attempts):
+            try:
+                return await function(*args, **kwargs)
+            except Exception as error:
+                if attempt + 1 >= self.attempts or not self.is_retryable(error):
+                    raise
+
+                delay = self.delay(attempt, error)
+
+                if on_retry:
+                    on_retry(attempt, error, delay)
+
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def sleep(delay, aborted=None, interval=0.1):
+        """
+        Wait for the delay, returning false as soon as the task is aborted.
+        """
+        end_time = time.monotonic() + delay
+
+        while (remaining := end_time - time.monotonic()) > 0:
+            if aborted and aborted():
+                return False
+
+            time.sleep(min(remaining, interval))
+
+        return not (aborted and aborted())
+
+
+def parse_retry_after(status, headers):
+    """
+    Seconds that a response asks to wait before the next request, from a 429 or 503 with a 'Retry-After' header.
+    """
+    if status not in (429, 503) or not headers or not (value := headers.get("retry-after")):
+        return None
+
+    if value.strip().isdigit():
+        return int(value)
+
+    try:
+        return max((arrow.get(parsedate_to_datetime(value)) - arrow.utcnow()).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def error_retry_after(error):
+    """
+    Seconds that the response behind an error asks to wait, from either a 'requests' or an 'aiohttp' error.
+    """
+    if (response := getattr(error, "response", None)) is not None:
+        return parse_retry_after(response.status_code, response.headers)
+
+    # The response errors of 'aiohttp' carry the status and the headers themselves
+    if isinstance(status := getattr(error, "status", None), int):
+        return parse_retry_after(status, getattr(error, "headers", None))
+
+    return None
@@ -0,0 +1,165 @@
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+
+from pathlib import Path
+
+
+class FileStore:
+    # Files are stored under the digest of their contents with this algorithm
+    hash_algorithm = "sha1"
+    # Size of the blocks read when hashing a file that is added to the store
+    hash_block_size = 1024 * 1024
+
+    def __init__(self, directory, capacity=4 * 1024 * 1024 * 1024):
+        self.__lock = threading.RLock()
+
+        self.directory = Path(directory)
+        self.objects_directory = self.directory / "objects"
+        self.objects_directory.mkdir(parents=True, exist_ok=True)
+
+        # The maximum number of bytes kept in the store, the least recently used files are evicted past this
+        self.capacity = capacity
+
+        self.__connection = sqlite3.connect(
+            str(self.directory / "store.db"), isolation_level=None, check_same_thread=False
+        )
+        self.__connection.execute("PRAGMA journal_mode = WAL")
+        self.__connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "file_id INTEGER PRIMARY KEY, "
+            "name TEXT NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "digest TEXT NOT NULL, "
+            "last_used REAL NOT NULL"
+            ")"
+        )
+        self.__connection.execute("CREATE INDEX IF NOT EXISTS files_digest ON files (digest)")
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def get(self, file_id):
+        with self.__lock:
+            row = self.__connection.execute(
+                "SELECT size, digest FROM files WHERE file_id = ?", (file_id,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            size, digest = row
+            path = self.__object_path(digest)
+
+            # An object that has gone missing or has been truncated is forgotten rather than handed out
+            try:
+                if path.stat().st_size != size:
+                    raise FileNotFoundError(path)
+            except FileNotFoundError:
+                self.__connection.execute("DELETE FROM files WHERE digest = ?", (digest,))
+                path.unlink(missing_ok=True)
+
+                return None
+
+            self.__connection.execute("UPDATE files SET last_used = ? WHERE file_id = ?", (time.time(), file_id))
+
+            return path
+
+    def digest(self, file_id):
+        with self.__lock:
+            row = self.__connection.execute("SELECT digest FROM files WHERE file_id = ?", (file_id,)).fetchone()
+
+            return row[0] if row else None
+
+    def add(self, file_id, path, name=None, digest=None):
+        """
+        Move the file at the path into the store, and return the path of the stored object.
+        """
+        path = Path(path)
+        digest = digest or FileStore.hash_file(path, self.hash_algorithm, self.hash_block_size)
+        object_path = self.__object_path(digest)
+
+        with self.__lock:
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+
+            # Identical contents are only ever stored once, no matter how many files they were added for
+            if object_path.exists():
+                path.unlink()
+            else:
+                shutil.move(str(path), str(object_path))
+
+            self.__connection.execute(
+                "INSERT OR REPLACE INTO files (file_id, name, size, digest, last_used) VALUES (?, ?, ?, ?, ?)",
+                (file_id, name or path.name, object_path.stat().st_size, digest, time.time())
+            )
+
+            # The file that was just added is kept even if it is bigger than the capacity on its own
+            self.evict(keep=digest)
+
+        return object_path
+
+    def link(self, file_id, destination):
+        """
+        Make the stored file available at the destination, returning false if the store does not have it.
+        """
+        if (object_path := self.get(file_id)) is None:
+            return False
+
+        destination = Path(destination)
+        destination.unlink(missing_ok=True)
+
+        # A hard link costs nothing, but is not possible across file systems, in which case a copy is made
+        try:
+            os.link(object_path, destination)
+        except OSError:
+            shutil.copyfile(str(object_path), str(destination))
+
+        return True
+
+    def evict(self, keep=None):
+        with self.__lock:
+            if not self.capacity:
+                return
+
+            # Each object may be referenced by more than one file ID, so usage is grouped by the digest
+            objects = self.__connection.execute(
+                "SELECT digest, MAX(size), MAX(last_used) FROM files GROUP BY digest ORDER BY MAX(last_used)"
+            ).fetchall()
+
+            total_size = sum(size for _, size, _ in objects)
+
+            for digest, size, _ in objects:
+                if total_size <= self.capacity:
+                    break
+
+                if digest == keep:
+                    continue
+
+                self.__connection.execute("DELETE FROM files WHERE digest = ?", (digest,))
+                self.__object_path(digest).unlink(missing_ok=True)
+
+                total_size -= size
+
+    @property
+    def size(self):
+        with self.__lock:
+            return self.__connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM files GROUP BY digest)"
+            ).fetchone()[0]
+
+    def __object_path(self, digest):
+        return self.objects_directory / digest[:2] / digest
+
+    @staticmethod
+    def hash_file(path, algorithm="sha1", block_size=1024 * 1024):
+        hasher = hashlib.new(algorithm)
+
+        with open(path, "rb") as file:
+            while data := file.read(block_size):
+                hasher.update(data)
+
+        return hasher.hexdigest()
@@ -1,13 +1,27 @@
 import re
+import time
 import string
 import random
 import secrets
 import unicodedata
+import concurrent.futures
 
 import requests
 
-from pathlib import Path
-from threading import Thread
+from pathlib import Path, PurePosixPath
+from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Bounds for the size of each read from a download when the block size is chosen from its throughput.
+# A read that is cut short by a dropped connection is lost entirely, so the maximum is kept small enough
+# that a partial file to be resumed holds nearly everything that was received.
+DOWNLOAD_MINIMUM_BLOCK_SIZE = 16 * 1024
+DOWNLOAD_MAXIMUM_BLOCK_SIZE = 256 * 1024
+# The amount of time that each read from a download should take when the block size is adaptive
+DOWNLOAD_TARGET_READ_TIME = 0.05
+# Seconds before a download from a list of mirrors is hedged with a request to the next one, without a `MirrorSelector`
+DOWNLOAD_HEDGE_DELAY = 1.0
 
 
 class DownloadException(Exception):
@@ -15,12 +29,22 @@ class DownloadException(Exception):
 
 
 class ProgressReporter:
-    def __init__(self, callback=None):
+    def __init__(self, callback=None, interval=None):
         self._maximum = 100
         self._value = 0
         self._done = False
         self.__callback = callback
 
+        # When an interval (in seconds) is given, changes to the value are coalesced and only forwarded
+        # to `_report_value` at most once per interval, as well as whenever the value is reset or complete.
+        self.interval = interval
+        self.__reported_value = None
+        self.__reported_time = 0
+        self.__pending = False
+
+        # A held back value may be flushed from another thread, such as a timer in the user interface
+        self.__lock = Lock()
+
     @property
     def maximum(self):
         return self._maximum
@@ -28,6 +52,10 @@ class ProgressReporter:
     @maximum.setter
     def maximum(self, value):
         self._maximum = value
+        self._report_maximum(value)
+
+        # Any value that is being held back may not make sense with the new maximum
+        self.flush()
 
     @property
     def value(self):
@@ -37,7 +65,42 @@ class ProgressReporter:
     def value(self, value):
         self._value = value
 
+        if self.interval is None:
+            self._report_value(value)
+            return
+
+        with self.__lock:
+            current_time = time.monotonic()
+
+            if not (
+                current_time - self.__reported_time >= self.interval or
+                self.__reported_value is None or
+                value < self.__reported_value or
+                0 < self._maximum <= value
+            ):
+                self.__pending = True
+                return
+
+            self.__reported_value = value
+            self.__reported_time = current_time
+            self.__pending = False
+
+            self._report_value(value)
+
+    def flush(self):
+        with self.__lock:
+            if not self.__pending:
+                return
+
+            self.__pending = False
+            self.__reported_value = self._value
+            self.__reported_time = time.monotonic()
+
+            self._report_value(self._value)
+
     def done(self):
+        self.flush()
+
         self._done = True
 
         if self.__callback:
@@ -46,27 +109,240 @@ class ProgressReporter:
     def is_done(self):
         return self._done
 
+    def _report_maximum(self, value):
+        pass
+
+    def _report_value(self, value):
+        pass
+
+
+def download_as_stream(url, path, reporter=None, block_size=None, session=None, resume=False, aborted=None,
+                       report_interval=0.1, hasher=None, mirrors=None, **kwargs):
+    # A default instance in the signature would be shared between concurrent downloads
+    reporter = reporter or ProgressReporter()
+
+    # When resuming, the data is written to a partial file next to the destination which is only renamed
+    # once it is complete, and whatever is already in it is requested again starting from its end.
+    part_path = path.with_name(path.name + ".part") if resume else path
+    offset = part_path.stat().st_size if resume and part_path.exists() else 0
+
+    headers = dict(kwargs.pop("headers", None) or dict())
+
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+
+    def __get(url_):
+        return (session or requests).get(url_, stream=True, allow_redirects=True, headers=headers, **kwargs)
+
+    # The same file may be given as a sequence of URLs from different mirrors, in which case the request
+    # goes to the best of them and is hedged with a request to the next one if the first is slow to respond.
+    if isinstance(url, str):
+        response = __get(url)
+    elif len(urls := list(url)) == 1:
+        # A single mirror has nothing to race against, so it is requested here without another thread to wait on
+        response = __get(url := urls[0])
+    else:
+        response, url = _get_mirrored(__get, urls, mirrors)
+
+    # The response must be closed in every case so that the connection is returned to the pool
+    with response:
+        if offset and response.status_code == 416:
+            # The range starts at or past the end of the file, which either means that the partial file
+            # is already complete, or that it does not belong to the file on the server and must be discarded.
+            if _content_range_total(response.headers.get("content-range")) == offset:
+                if hasher:
+                    _hash_file_into(hasher, part_path)
+
+                part_path.replace(path)
+                reporter.maximum = reporter.value = offset
+                reporter.done()
+
+                return path
+
+            part_path.unlink()
+
+            return download_as_stream(
+                url, path, reporter=reporter, block_size=block_size, session=session, resume=resume, aborted=aborted,
+                report_interval=report_interval, hasher=hasher, mirrors=mirrors, **kwargs
+            )
+
+        response.raise_for_status()
+
+        # A server that ignores the range sends the whole file again
+        if response.status_code != 206:
+            offset = 0
+
+        # The hasher is given every byte as it is written, only the part that was resumed has to be read again
+        if hasher and offset:
+            _hash_file_into(hasher, part_path)
+
+        reporter.maximum = int(response.headers.get("content-length", 0))
+        reporter.maximum += offset if reporter.maximum else 0
+        reporter.value = received = offset
+
+        # Without a fixed block size, the size of each read follows the throughput of the download so that
+        # a read takes roughly the same amount of time whether the connection is slow or fast.
+        adaptive = not block_size
+        read_size = DOWNLOAD_MINIMUM_BLOCK_SIZE if adaptive else block_size
+
+        # Every read goes into the same buffer and is written from a view of it, nothing is allocated per block
+        buffer = memoryview(bytearray(DOWNLOAD_MAXIMUM_BLOCK_SIZE if adaptive else block_size))
+
+        response.raw.decode_content = True
+
+        with open(part_path, "ab" if offset else "wb") as file:
+            last_report = last_read = time.monotonic()
 
-def download_as_stream(url, path, reporter=ProgressReporter(), block_size=1024, **kwargs):
-    response = requests.get(url, stream=True, allow_redirects=True, **kwargs)
-    response.raise_for_status()
+            while count := response.raw.readinto(buffer[:read_size]):
+                if aborted and aborted():
+                    raise DownloadException("Download was cancelled")
 
-    reporter.maximum = int(response.headers.get("content-length", 0))
-    reporter.value = 0
+                file.write(buffer[:count])
+                received += count
 
-    with open(path, "wb") as file:
-        for data in response.iter_content(block_size):
-            reporter.value += len(data)
-            file.write(data)
+                if hasher:
+                    hasher.update(buffer[:count])
 
+                current_time = time.monotonic()
+
+                if adaptive:
+                    # Throughput is measured from a single read, and the next read is sized to take the target time
+                    if (read_time := current_time - last_read) > 0:
+                        read_size = int(count / read_time * DOWNLOAD_TARGET_READ_TIME)
+                        read_size = max(DOWNLOAD_MINIMUM_BLOCK_SIZE, min(read_size, DOWNLOAD_MAXIMUM_BLOCK_SIZE))
+                    else:
+                        read_size = min(read_size * 2, DOWNLOAD_MAXIMUM_BLOCK_SIZE)
+
+                    last_read = current_time
+
+                # Progress is reported on an interval instead of per block
+                if current_time - last_report >= report_interval:
+                    reporter.value = received
+                    last_report = current_time
+
+    reporter.value = received
     reporter.done()
 
+    # Any session will do, but only a `ConnectionPool` keeps statistics of the bytes received from each host
+    if (record := getattr(session, "record", None)) is not None:
+        record(url, received - offset)
+
     if reporter.maximum != 0 and reporter.value != reporter.maximum:
+        # A partial file that is too short can still be resumed, but one that is too long is corrupt
+        if resume and reporter.value > reporter.maximum:
+            part_path.unlink()
+
         raise DownloadException("Downloaded bytes did not match 'content-length' header")
 
+    if resume:
+        part_path.replace(path)
+
     return path
 
 
+def _get_mirrored(get, urls, mirrors=None):
+    urls = list(mirrors.rank(urls) if mirrors else urls)
+    primary_url = urls[0]
+    executor = ThreadPoolExecutor(max_workers=len(urls))
+    started_at = dict()
+    pending = dict()
+    error = None
+
+    def __submit(url_):
+        started_at[url_] = time.monotonic()
+        pending[executor.submit(get, url_)] = url_
+
+    def __on_lost(future_, url_):
+        # The slower response is only waited for to measure its latency, and then discarded
+        try:
+            future_.result().close()
+
+            if mirrors:
+                mirrors.record_success(url_, time.monotonic() - started_at[url_])
+        except Exception:
+            if mirrors:
+                mirrors.record_failure(url_)
+
+    __submit(urls.pop(0))
+
+    try:
+        while pending:
+            # Once every mirror has been asked there is nothing left to hedge with, and the wait has no timeout
+            if not urls:
+                hedge_delay = None
+            elif mirrors:
+                hedge_delay = mirrors.hedge_delay(next(iter(pending.values())))
+            else:
+                hedge_delay = DOWNLOAD_HEDGE_DELAY
+
+            done, _ = concurrent.futures.wait(
+                pending, timeout=hedge_delay, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+
+            if not done:
+                __submit(urls.pop(0))
+                continue
+
+            for future in done:
+                url = pending.pop(future)
+
+                try:
+                    response = future.result()
+                except Exception as error_:
+                    response, error = None, error_
+
+                # A range that can't be satisfied is answered the same by every mirror, the caller handles it
+                if response is not None and (response.status_code < 400 or response.status_code == 416):
+                    if mirrors:
+                        mirrors.record_success(url, time.monotonic() - started_at[url], fallback=url != primary_url)
+
+                    for future_, url_ in pending.items():
+                        future_.add_done_callback(lambda future__, url__=url_: __on_lost(future__, url__))
+
+                    return response, url
+
+                if mirrors:
+                    mirrors.record_failure(url)
+
+                # The last failed response is kept so that raising for its status gives the real error
+                if response is not None:
+                    if pending or urls:
+                        response.close()
+                    else:
+                        return response, url
+
+                # A failed mirror is replaced right away instead of waiting for the hedge delay
+                if urls and not pending:
+                    __submit(urls.pop(0))
+
+        raise error
+    finally:
+        executor.shutdown(wait=False)
+
+
+def _content_range_total(content_range):
+    # The header takes the form of 'bytes <start>-<end>/<total>' or 'bytes */<total>'
+    if not content_range or not (total := content_range.rpartition("/")[2]).isdigit():
+        return None
+
+    return int(total)
+
+
+def _hash_file_into(hasher, path, block_size=1024 * 1024):
+    with open(path, "rb") as file:
+        while data := file.read(block_size):
+            hasher.update(data)
+
+
+def zip_member_path(filename):
+    """
+    The relative path that a member will be extracted to, sanitized in the same way as `ZipFile.extract`.
+    """
+    parts = PurePosixPath(filename.replace("\\", "/")).parts
+
+    return Path(*(part for part in parts if part not in ("", ".", "..", "/") and not part.endswith(":")))
+
+
 def make_thread(*args, **kwargs):
     def wrapper(func):
         return Thread(target=func, *args, **kwargs)